@@ -1,7 +1,25 @@
-from api_toolkit import crud, auth, state_item
+import importlib
+from typing import TYPE_CHECKING
 
 __all__ = [
     "crud",
     "auth",
+    "db",
     "state_item",
 ]
+
+if TYPE_CHECKING:
+    from api_toolkit import crud, auth, db, state_item
+
+
+def __getattr__(name: str):
+    # subpackages load on first access, so `api_toolkit.crud` users never import fastapi-users or graphviz
+    if name in __all__:
+        module = importlib.import_module(f"{__name__}.{name}")
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
@@ -1,4 +1,5 @@
 from .factory import AuthFactory
+from .password import PasswordHasher
 from .router import AuthRouter
 from .auth import Auth
 
@@ -6,4 +7,5 @@ __all__ = [
     "AuthRouter",
     "AuthFactory",
     "Auth",
+    "PasswordHasher",
 ]
@@ -1,7 +1,10 @@
-from typing import List, Coroutine, Any, Callable
+from typing import List, Coroutine, Any, Callable, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi_users import FastAPIUsers
+from pydantic import UUID4
+from sqlalchemy import literal
+from sqlalchemy.sql import Select
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
@@ -12,6 +15,24 @@ NOT_ANY_GROUP = HTTPException(status_code=status.HTTP_404_NOT_FOUND,
                               detail="You are not in any group.")
 
 
+def group_tree_ids(group_db: Any, root_id: UUID4) -> Select:
+    """Select the ids of `root_id` and all of its descendant groups with one recursive query."""
+    tree = select(group_db.id).where(group_db.id == root_id).cte(name="group_tree", recursive=True)
+    tree = tree.union_all(select(group_db.id).where(group_db.parent_id == tree.c.id))
+    return select(tree.c.id)
+
+
+def group_tree_depths(group_db: Any, root_id: UUID4, max_depth: Optional[int] = None) -> Select:
+    """Select `(id, depth)` of `root_id` (depth 0) and its descendants down to `max_depth`."""
+    tree = select(group_db.id, literal(0).label("depth")).where(group_db.id == root_id) \
+        .cte(name="group_depths", recursive=True)
+    step = select(group_db.id, (tree.c.depth + 1).label("depth")).where(group_db.parent_id == tree.c.id)
+    if max_depth is not None:
+        step = step.where(tree.c.depth < max_depth)
+    tree = tree.union_all(step)
+    return select(tree.c.id, tree.c.depth)
+
+
 class Auth:
     _router: APIRouter
     _fastapi_users: FastAPIUsers
@@ -41,19 +62,22 @@ class Auth:
     def _own_groups(self) -> Callable[[GP, AsyncSession], Coroutine[Any, Any, List[GP]]]:
         async def _own_groups(g: GP = Depends(self.current_group),
                               db: AsyncSession = Depends(self._get_async_session)) -> List[GP]:
-            async def get_children(group: GP, groups: List[GP]):
-                for child in (await db.execute(select(self._config.GroupDB).where(
-                        self._config.GroupDB.parent_id == group.id))).all():
-                    groups.append(*child)
-                    for cg in child:
-                        await get_children(cg, groups)
-
-            gs = [g]
-            await get_children(g, gs)
-            return gs
+            return (await db.exec(select(self._config.GroupDB).where(
+                self._config.GroupDB.id.in_(self.group_ids(g.id))))).all()
 
         return _own_groups
 
+    def group_ids(self, root_id: UUID4, group_id: Optional[UUID4] = None) -> Select:
+        """
+        Select the ids of `root_id` and all of its descendant groups with one recursive query,
+        usable as a semi-join (`own_group_id IN (...)`) so the group scope never leaves the database.
+        If `group_id` is given, only that id is selected, and only when it belongs to the subtree.
+        """
+        query = group_tree_ids(self._config.GroupDB, root_id)
+        if group_id:
+            query = query.where(query.selected_columns[0] == group_id)
+        return query
+
     @property
     def router(self):
         return self._router
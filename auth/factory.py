@@ -1,8 +1,10 @@
 import uuid
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 from fastapi import Depends, Request
-from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin
+from fastapi.routing import APIRoute
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, exceptions, schemas
 from fastapi_users.authentication import (
     AuthenticationBackend,
     BearerTransport,
@@ -11,7 +13,10 @@ from fastapi_users.authentication import (
 from fastapi_users_db_sqlmodel import SQLModelUserDatabase, SQLModelUserDatabaseAsync
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from api_toolkit.crud.encoding import ResponseEncoding
+from api_toolkit.db.instrument import QueryInstrumentation
 from .auth import Auth
+from .password import PasswordHasher
 from .router import AuthRouter
 
 from .config import AuthConfigBase
@@ -40,7 +45,8 @@ class AuthFactory:
     def config(self) -> AuthConfigBase:
         return self._config
 
-    def _make_fastapi_users(self, get_async_session, secret: str) -> Tuple[FastAPIUsers, AuthenticationBackend]:
+    def _make_fastapi_users(self, get_async_session, secret: str,
+                            hasher: PasswordHasher) -> Tuple[FastAPIUsers, AuthenticationBackend]:
         self_config = self.config()
         auth_backend = make_auth_backend(secret)
 
@@ -48,6 +54,54 @@ class AuthFactory:
             reset_password_token_secret = secret
             verification_token_secret = secret
 
+            # hash and verify calls of the mounted login, register and users routes go through `hasher`
+
+            async def authenticate(self, credentials: OAuth2PasswordRequestForm) -> Optional[self_config.User]:
+                try:
+                    user = await self.get_by_email(credentials.username)
+                except exceptions.UserNotExists:
+                    # Run the hasher to mitigate timing attack
+                    await hasher.hash(credentials.password)
+                    return None
+
+                verified, updated_password_hash = await hasher.verify_and_update(
+                    credentials.password, user.hashed_password
+                )
+                if not verified:
+                    return None
+                if updated_password_hash is not None:
+                    await self.user_db.update(user, {"hashed_password": updated_password_hash})
+                return user
+
+            async def create(self, user_create: schemas.UC, safe: bool = False,
+                             request: Optional[Request] = None) -> self_config.User:
+                await self.validate_password(user_create.password, user_create)
+
+                existing_user = await self.user_db.get_by_email(user_create.email)
+                if existing_user is not None:
+                    raise exceptions.UserAlreadyExists()
+
+                user_dict = (
+                    user_create.create_update_dict()
+                    if safe
+                    else user_create.create_update_dict_superuser()
+                )
+                password = user_dict.pop("password")
+                user_dict["hashed_password"] = await hasher.hash(password)
+
+                created_user = await self.user_db.create(user_dict)
+                await self.on_after_register(created_user, request)
+                return created_user
+
+            async def _update(self, user: self_config.User, update_dict: Dict[str, Any]) -> self_config.User:
+                password = update_dict.get("password")
+                if password is None:
+                    return await super()._update(user, update_dict)
+                await self.validate_password(password, user)
+                update_dict = {k: v for k, v in update_dict.items() if k != "password"}
+                update_dict["hashed_password"] = await hasher.hash(password)
+                return await super()._update(user, update_dict)
+
             async def on_after_register(self, user: self_config.User, request: Optional[Request] = None):
                 print(f"User {user.id} has registered.")
 
@@ -70,7 +124,12 @@ class AuthFactory:
         fastapi_users = FastAPIUsers[self_config.User, uuid.UUID](get_user_manager, [auth_backend])
         return fastapi_users, auth_backend
 
-    def __call__(self, get_async_session, secret: str) -> Auth:
-        fastapi_users, auth_backend = self._make_fastapi_users(get_async_session, secret)
-        router = AuthRouter(fastapi_users, auth_backend, self.config(), get_async_session)
+    def __call__(self, get_async_session, secret: str, password_hasher: Optional[PasswordHasher] = None,
+                 get_async_read_session=None, instrumentation: Optional[QueryInstrumentation] = None,
+                 response_encoding: Optional[ResponseEncoding] = None) -> Auth:
+        fastapi_users, auth_backend = self._make_fastapi_users(get_async_session, secret,
+                                                               password_hasher or PasswordHasher())
+        router = AuthRouter(fastapi_users, auth_backend, self.config(), get_async_session, get_async_read_session,
+                            dependencies=[Depends(instrumentation.dependency)] if instrumentation else None,
+                            route_class=response_encoding.route_class if response_encoding else APIRoute)
         return Auth(self._config, router, fastapi_users, get_async_session)
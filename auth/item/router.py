@@ -1,16 +1,26 @@
-from fastapi import HTTPException, status, Depends
-from typing import Any, Callable, List, Type, Optional, Union, Generator
+from fastapi import Body, File, HTTPException, Query, UploadFile, status, Depends
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Type, Optional, Union, Generator
 
 from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlmodel import paginate
-from pydantic import UUID4
-from sqlalchemy import text
+from pydantic import UUID4, BaseModel, create_model
+from sqlalchemy import bindparam, text, tuple_, update
+from sqlalchemy.sql import ColumnElement, Select
+from sqlmodel.sql.expression import SelectOfScalar
 
 from api_toolkit.crud import SQLModelCRUDRouter
+from api_toolkit.crud.base import ItemsByIds
+from api_toolkit.crud.changes import MATCH
+from api_toolkit.crud.crud import DELTA_LIMIT, ORDER, UpsertResult
+from api_toolkit.crud.delta import Delta, tombstone
+from api_toolkit.crud.importer import ImportFormat, ImportReport
+from api_toolkit.crud.statements import paginate_prebuilt
 from api_toolkit.crud.types import DEPENDENCIES, PYDANTIC_SCHEMA as SCHEMA
+from api_toolkit.db.instrument import QueryInstrumentation
 from .models import AuthItemBase
 from .. import Auth
-from ..models import GP
+from ..auth import NOT_ANY_GROUP
+from ..models import UP
 
 try:
     from sqlmodel import SQLModel, Session, select, col
@@ -36,6 +46,17 @@ CALLABLE_LIST = Callable[..., Page[SQLModel]]
 SESSION_FUNC = Callable[..., Generator[Session, Any, None]]
 
 
+class ChangeOwnerResult(BaseModel):
+    count: int
+
+
+def upsert_schema_factory(db_model: Type[AuthItemBase]) -> Type[BaseModel]:
+    """The fields of `db_model` with their defaults, except `own_group_id`."""
+    fields = {name: (field.outer_type_, field.field_info)
+              for name, field in db_model.__fields__.items() if name != "own_group_id"}
+    return create_model(f"{db_model.__name__}Upsert", **fields)  # type: ignore
+
+
 class AuthCRUDRouter(SQLModelCRUDRouter):
     db_model: Type[AuthItemBase]
 
@@ -55,11 +76,19 @@ class AuthCRUDRouter(SQLModelCRUDRouter):
             delete_one_route: Union[bool, DEPENDENCIES] = True,
             delete_all_route: Union[bool, DEPENDENCIES] = True,
             change_owner_route: Union[bool, DEPENDENCIES] = True,
+            bulk_change_owner_route: Union[bool, DEPENDENCIES] = True,
+            read_db_func: Optional[SESSION_FUNC] = None,
+            read_your_writes: float = 0,
+            instrumentation: Optional[QueryInstrumentation] = None,
+            get_many_route: Union[bool, DEPENDENCIES] = True,
             **kwargs: Any
     ):
         self.auth = auth
         self.db_func = db_func
         self.db_model = db_model
+        if kwargs.get("upsert_schema") is None:
+            # the group comes from the `group_id` parameter, as for create
+            kwargs["upsert_schema"] = upsert_schema_factory(db_model)
         super().__init__(
             db_func=db_func,
             db_model=db_model,
@@ -69,10 +98,14 @@ class AuthCRUDRouter(SQLModelCRUDRouter):
             tags=tags,
             get_all_route=get_all_route,
             get_one_route=get_one_route,
+            get_many_route=get_many_route,
             create_route=create_route,
             update_route=update_route,
             delete_one_route=delete_one_route,
             delete_all_route=delete_all_route,
+            read_db_func=read_db_func,
+            read_your_writes=read_your_writes,
+            instrumentation=instrumentation,
             **kwargs
         )
         if change_owner_route:
@@ -84,119 +117,307 @@ class AuthCRUDRouter(SQLModelCRUDRouter):
                 summary="Change Owner",
                 dependencies=False,
             )
+        if bulk_change_owner_route:
+            self._add_api_route(
+                path="/change_owner",
+                endpoint=self._bulk_change_owner(),
+                methods=["POST"],
+                response_model=ChangeOwnerResult,
+                summary="Change Owner of Many",
+                dependencies=bulk_change_owner_route,
+            )
 
     def _require_own_groups(self):
+        """
+        Resolve the caller's group scope as a subquery of group ids, the optional `group_id`
+        narrows it to a single group of the caller's subtree.
+        """
         def route(group_id: Optional[UUID4] = None,
-                  own_groups: List[GP] = Depends(self.auth.own_groups)) -> List[GP]:
-            if not group_id:
-                return own_groups
-
-            for group in own_groups:
-                if group.id == group_id:
-                    return [group]
-            raise NO_AUTH_OF_THIS_GROUP
+                  user: UP = Depends(self.auth.current_user),
+                  db: Session = Depends(self.db_func)) -> Select:
+            if not user.group_id:
+                raise NOT_ANY_GROUP
+            groups = self.auth.group_ids(user.group_id, group_id)
+            if group_id and not db.execute(groups).first():
+                raise NO_AUTH_OF_THIS_GROUP
+            return groups
 
         return route
 
     def _require_own_group(self):
         def route(group_id: UUID4,
-                  own_groups: List[GP] = Depends(self.auth.own_groups)) -> GP:
-            for group in own_groups:
-                if group.id == group_id:
-                    return group
-            raise NO_AUTH_OF_THIS_GROUP
+                  user: UP = Depends(self.auth.current_user),
+                  db: Session = Depends(self.db_func)) -> UUID4:
+            if not user.group_id:
+                raise NOT_ANY_GROUP
+            if not db.execute(self.auth.group_ids(user.group_id, group_id)).first():
+                raise NO_AUTH_OF_THIS_GROUP
+            return group_id
 
         return route
 
+    def _changes_match(self) -> Callable[..., MATCH]:
+        def match(groups: Select = Depends(self._require_own_groups()),
+                  db: Session = Depends(self._read_db())) -> MATCH:
+            scope = {str(group_id) for group_id in db.execute(groups).scalars()}
+            # the stream outlives the request, do not keep its connection checked out meanwhile
+            db.close()
+            return lambda event: event.group_id in scope or event.previous_group_id in scope
+
+        return match
+
+    def _aggregate_scope(self) -> Callable[..., ColumnElement]:
+        def scope(groups: Select = Depends(self._require_own_groups())) -> ColumnElement:
+            return col(self.db_model.own_group_id).in_(groups)
+
+        return scope
+
+    def _scoped_query(self, groups: Select) -> SelectOfScalar:
+        return select(self.db_model).where(col(self.db_model.own_group_id).in_(groups))
+
+    def _scoped_statement(self, narrowed: bool) -> SelectOfScalar:
+        """`_scoped_query` with the scope bound as `scope_root` and, when `narrowed`, `scope_group`."""
+        groups = self.auth.group_ids(bindparam("scope_root"))
+        if narrowed:
+            groups = groups.where(groups.selected_columns[0] == bindparam("scope_group"))
+        return self._scoped_query(groups)
+
+    @staticmethod
+    def _scope_values(user: UP, group_id: Optional[UUID4]) -> Dict[str, Any]:
+        return {"scope_root": user.group_id, "scope_group": group_id}
+
     def _get_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
-        def route(groups: List[GP] = Depends(self._require_own_groups()),
-                  order=Depends(self._order_by_depend()),
+        def route(groups: Select = Depends(self._require_own_groups()),
+                  order: ORDER = Depends(self._order_by_depend()),
                   filter_=Depends(self._filter_depend()),
-                  db: Session = Depends(self.db_func)) -> Page[SQLModel]:
-            query = select(self.db_model).where(col(self.db_model.own_group_id).in_([g.id for g in groups]))
-            if order:
-                order_key, order_dir = order
-                query = query.order_by(text(f'{order_key.value} {order_dir.value}'))
-            if filter_:
-                filter_key, filter_value = filter_
-                query = query.where(text(f'{filter_key.value} = :filter_value')).params(filter_value=filter_value)
-            return paginate(db, query)
+                  db: Session = Depends(self._read_db()),
+                  user: UP = Depends(self.auth.current_user),
+                  group_id: Optional[UUID4] = None) -> Page[SQLModel]:
+            # `groups` checks the scope, the prebuilt statement takes its values
+            filter_key, values = (filter_[0].value, {"filter_value": filter_[1]}) if filter_ else (None, {})
+            narrowed = group_id is not None
+            statements = self.statement_cache.get(
+                ("list", narrowed, filter_key, order),
+                lambda: self._page_statements(self._scoped_statement(narrowed), filter_key, order))
+            return paginate_prebuilt(db, statements, {**values, **self._scope_values(user, group_id)})
 
         return route
 
+    def _fetch_one(self, db: Session, item_id: Any, scope: Dict[str, Any]) -> SQLModel:
+        narrowed = scope["scope_group"] is not None
+        pk = getattr(self.db_model, self._pk)
+        query = self.statement_cache.get(
+            ("one", narrowed), lambda: self._scoped_statement(narrowed).where(pk == bindparam("item_id")))
+        item = db.execute(query, {**scope, "item_id": item_id}).scalars().first()
+        if item:
+            return item
+        # only the primary key is read back to tell a missing item from a foreign one
+        exists = self.statement_cache.get("exists", lambda: select(pk).where(pk == bindparam("item_id")))
+        if db.execute(exists, {"item_id": item_id}).first():
+            raise NO_AUTH_OF_THIS_GROUP
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Item not found")
+
     def _get_one(self, *args: Any, **kwargs: Any) -> CALLABLE:
         def route(item_id: self._pk_type,  # type: ignore
-                  groups: List[GP] = Depends(self._require_own_groups()),
-                  db: Session = Depends(self.db_func)) -> SQLModel:
-            item = db.get(self.db_model, item_id)
-            if not item:
-                raise HTTPException(status.HTTP_404_NOT_FOUND, "Item not found")
-            if item.own_group_id not in [g.id for g in groups]:
-                raise NO_AUTH_OF_THIS_GROUP
-            return item
+                  groups: Select = Depends(self._require_own_groups()),
+                  db: Session = Depends(self._read_db()),
+                  user: UP = Depends(self.auth.current_user),
+                  group_id: Optional[UUID4] = None) -> SQLModel:
+            return self._fetch_one(db, item_id, self._scope_values(user, group_id))
+
+        return route
+
+    def _get_many(self, in_body: bool = False, *args: Any, **kwargs: Any) -> Callable[..., ItemsByIds]:
+        def route(ids: List[Any] = Depends(self._ids_depend(in_body)),
+                  groups: Select = Depends(self._require_own_groups()),
+                  db: Session = Depends(self._read_db())) -> ItemsByIds:
+            # ids outside the caller's groups come back as missing, the same as ids that do not exist
+            return self._items_by_ids(db, self._scoped_query(groups), ids)
 
         return route
 
     def _create(self, *args: Any, **kwargs: Any) -> CALLABLE:
         def route(model: self.create_schema,  # type: ignore
-                  group: GP = Depends(self._require_own_group()),
+                  group_id: UUID4 = Depends(self._require_own_group()),
                   db: Session = Depends(self.db_func)) -> SQLModel:
             db_model: SQLModel = self.db_model(**model.dict())
-            db_model.own_group_id = group.id
+            db_model.own_group_id = group_id
             db.add(db_model)
             db.commit()
             db.refresh(db_model)
+            self._publish("create", db_model, db_model)
             return db_model
 
         return route
 
+    def _foreign_conflicts(self, db: Session, rows: List[Dict[str, Any]], user: UP) -> bool:
+        """Whether any row collides, on the conflict keys, with an existing item outside the caller's groups."""
+        keys = self.upsert_conflict_keys
+        columns = [col(getattr(self.db_model, key)) for key in keys]
+        target = columns[0] if len(columns) == 1 else tuple_(*columns)
+        values = [row[keys[0]] if len(keys) == 1 else tuple(row[key] for key in keys)
+                  for row in rows if all(row.get(key) is not None for key in keys)]
+        foreign = col(self.db_model.own_group_id).notin_(self.auth.group_ids(user.group_id))
+        for start in range(0, len(values), self.upsert_batch_size):
+            query = select(getattr(self.db_model, self._pk)).where(
+                target.in_(values[start:start + self.upsert_batch_size]), foreign).limit(1)
+            if db.execute(query).first():
+                return True
+        return False
+
+    def _upsert(self, *args: Any, **kwargs: Any) -> Callable[..., UpsertResult]:
+        def route(models: Union[List[self.upsert_schema], self.upsert_schema],  # type: ignore
+                  group_id: UUID4 = Depends(self._require_own_group()),
+                  user: UP = Depends(self.auth.current_user),
+                  db: Session = Depends(self.db_func)) -> UpsertResult:
+            """
+            New items are created in `group_id`, existing ones must be in the caller's groups and keep their group.
+            On MySQL a collision on another unique key than the conflict keys is not checked against the scope.
+            """
+            rows = self._upsert_rows(models if isinstance(models, list) else [models])
+            if not rows:
+                return UpsertResult(count=0)
+            for row in rows:
+                row["own_group_id"] = group_id
+            if self._foreign_conflicts(db, rows, user):
+                raise NO_AUTH_OF_THIS_GROUP
+            self._execute_upsert(db, rows, [name for name in self.upsert_update_fields
+                                            if name in rows[0] and name != "own_group_id"])
+            self._publish("upsert", group_id=str(group_id), data={"count": len(rows)})
+            return UpsertResult(count=len(rows))
+
+        return route
+
+    def _import(self, *args: Any, **kwargs: Any) -> Callable[..., ImportReport]:
+        def route(file: UploadFile = File(..., description="NDJSON, or CSV with a header row"),
+                  format: Optional[ImportFormat] = Query(None, description="default: from the file name or type"),
+                  group_id: UUID4 = Depends(self._require_own_group()),
+                  db: Session = Depends(self.db_func)) -> ImportReport:
+            # every row is created in `group_id`, whatever group the file names
+            report = self._import_file(db, file, format, {"own_group_id": group_id})
+            if report.inserted:
+                self._publish("import", group_id=str(group_id), data={"count": report.inserted})
+            return report
+
+        return route
+
+    def _delta(self, *args: Any, **kwargs: Any) -> Callable[..., Delta]:
+        def route(since: Optional[str] = Query(None, description="token of the previous response, omit to start over"),
+                  limit: int = Query(500, ge=1, le=DELTA_LIMIT),
+                  groups: Select = Depends(self._require_own_groups()),
+                  db: Session = Depends(self.db_func)) -> Delta:
+            """
+            Rows written and ids deleted since `since` within the caller's groups, in (timestamp, pk) keyset order.
+            An item moved to another group is reported as deleted to the feed of its previous group.
+            """
+            return self._delta_page(db, since, limit, self._scoped_query(groups),
+                                    self.tombstones.c.group_id.in_(groups))
+
+        return route
+
     def _update(self, *args: Any, **kwargs: Any) -> CALLABLE:
         def route(item_id: self._pk_type,  # type: ignore
                   model: self.update_schema,  # type: ignore
-                  groups: List[GP] = Depends(self._require_own_groups()),
-                  db: Session = Depends(self.db_func)) -> SQLModel:
-            db_model: SQLModel = self._get_one()(item_id, groups, db)
+                  groups: Select = Depends(self._require_own_groups()),
+                  db: Session = Depends(self.db_func),
+                  user: UP = Depends(self.auth.current_user),
+                  group_id: Optional[UUID4] = None) -> SQLModel:
+            db_model: SQLModel = self._fetch_one(db, item_id, self._scope_values(user, group_id))
+            previous_group_id = str(db_model.own_group_id)
             for key, value in model.dict(exclude={self._pk}).items():
                 if hasattr(db_model, key):
                     setattr(db_model, key, value)
             db.commit()
             db.refresh(db_model)
+            self._publish("update", db_model, db_model, previous_group_id=previous_group_id)
             return db_model
 
         return route
 
     def _delete_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
-        def route(groups: List[GP] = Depends(self._require_own_groups()),
+        def route(groups: Select = Depends(self._require_own_groups()),
                   db: Session = Depends(self.db_func)) -> List[SQLModel]:
-            for item in db.exec(
-                    select(self.db_model).where(
-                        col(self.db_model.own_group_id).in_([g.id for g in groups]))
-            ).all():
+            items = db.exec(self._scoped_query(groups)).all()
+            for item in items:
                 db.delete(item)
             db.commit()
-            return self._get_all()(groups, db)
+            for item in items:
+                self._publish("delete", item)
+            # the rows left over, as a list: the route is not paginated
+            return db.exec(self._scoped_query(groups).order_by(getattr(self.db_model, self._pk))).all()
 
         return route
 
     def _delete_one(self, *args: Any, **kwargs: Any) -> CALLABLE:
         def route(item_id: self._pk_type,  # type: ignore
-                  groups: List[GP] = Depends(self._require_own_groups()),
-                  db: Session = Depends(self.db_func)) -> None:
-            db_model: SQLModel = self._get_one()(item_id, groups, db)
+                  groups: Select = Depends(self._require_own_groups()),
+                  db: Session = Depends(self.db_func),
+                  user: UP = Depends(self.auth.current_user),
+                  group_id: Optional[UUID4] = None) -> None:
+            db_model: SQLModel = self._fetch_one(db, item_id, self._scope_values(user, group_id))
             db.delete(db_model)
             db.commit()
+            self._publish("delete", db_model)
             return db_model
 
         return route
 
     def _change_owner(self, *args: Any, **kwargs: Any) -> CALLABLE:
         def route(item_id: self._pk_type,  # type: ignore
-                  target_group: GP = Depends(self._require_own_group()),
+                  target_group_id: UUID4 = Depends(self._require_own_group()),
+                  user: UP = Depends(self.auth.current_user),
                   db: Session = Depends(self.db_func)) -> SQLModel:
-            db_model: SQLModel = db.get(self.db_model, item_id)
-            db_model.own_group_id = target_group.id
+            db_model: SQLModel = self._fetch_one(db, item_id, self._scope_values(user, None))
+            previous_group_id = str(db_model.own_group_id)
+            db_model.own_group_id = target_group_id
             db.commit()
             db.refresh(db_model)
+            self._publish("change_owner", db_model, db_model, previous_group_id=previous_group_id)
             return db_model
 
         return route
+
+    def _bulk_change_owner(self, *args: Any, **kwargs: Any) -> Callable[..., ChangeOwnerResult]:
+        def route(ids: Optional[List[self._pk_type]] = Body(None),  # type: ignore
+                  source_group_id: Optional[UUID4] = Body(None),
+                  include_descendants: bool = Body(False),
+                  target_group_id: UUID4 = Depends(self._require_own_group()),
+                  user: UP = Depends(self.auth.current_user),
+                  db: Session = Depends(self.db_func)) -> ChangeOwnerResult:
+            """Move the items `ids`, or all items of `source_group_id`, to `group_id` with one UPDATE."""
+            if (ids is None) == (source_group_id is None):
+                raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                    "Give either ids or source_group_id.")
+            own_group_id = col(self.db_model.own_group_id)
+            if ids is not None:
+                where = [col(getattr(self.db_model, self._pk)).in_(ids),
+                         own_group_id.in_(self.auth.group_ids(user.group_id))]
+            else:
+                if not db.execute(self.auth.group_ids(user.group_id, source_group_id)).first():
+                    raise NO_AUTH_OF_THIS_GROUP
+                # the subtree of a group in the caller's scope is in scope as a whole
+                where = [own_group_id.in_(self.auth.group_ids(source_group_id)) if include_descendants
+                         else own_group_id == source_group_id]
+            values: Dict[str, Any] = {"own_group_id": target_group_id}
+            if self.delta_column is not None:
+                # the UPDATE skips the ORM listeners of the delta route, stamp and bury here instead
+                values[self.delta_column] = datetime.now()
+                pk = col(getattr(self.db_model, self._pk))
+                leaving = db.execute(select(pk, own_group_id).where(*where, own_group_id != target_group_id)).all()
+                if leaving:
+                    db.execute(self.tombstones.insert(), [tombstone(self.db_model.__tablename__, item_id, group_id)
+                                                          for item_id, group_id in leaving])
+            result = db.execute(update(self.db_model).where(*where).values(**values)
+                                .execution_options(synchronize_session=False))
+            count = result.rowcount
+            if count < 0 and db.get_bind().dialect.name == "sqlite":
+                # pysqlite reports no row count for statements starting with the WITH of the group scope
+                count = db.execute(text("SELECT changes()")).scalar()
+            db.commit()
+            if count:
+                # items of several groups may have moved, only the groups named in the request are known
+                self._publish("change_owner", group_id=str(target_group_id), data={"count": count},
+                              previous_group_id=str(source_group_id) if source_group_id else None)
+            return ChangeOwnerResult(count=count)
+
+        return route
@@ -1,12 +1,13 @@
 import uuid
 from datetime import datetime
-from typing import Optional, List, Protocol, TypeVar
+from typing import Optional, List, Protocol, Type, TypeVar
 
 from fastapi_users import schemas
 from fastapi_users.models import UserProtocol as BaseUserProtocol
 
 from fastapi_users_db_sqlmodel import SQLModelBaseUserDB
 from pydantic import UUID4
+from sqlalchemy import event
 from sqlalchemy.orm import backref
 from sqlmodel import SQLModel, Field, Relationship
 
@@ -48,6 +49,15 @@ class BaseUserDB(SQLModelBaseUserDB):
 
     created_at: datetime = Field(default_factory=datetime.now, nullable=True)
 
+    # lower-cased copy of `email`, kept by the listener below and indexed for prefix search
+    email_normalized: Optional[str] = Field(default=None, index=True, nullable=True)
+
+
+@event.listens_for(BaseUserDB, "before_insert", propagate=True)
+@event.listens_for(BaseUserDB, "before_update", propagate=True)
+def _normalize_email(mapper, connection, target: BaseUserDB) -> None:
+    target.email_normalized = target.email.strip().lower() if target.email else target.email
+
 
 # </editor-fold>
 
@@ -60,6 +70,16 @@ class BaseGroup(SQLModel):
     created_at: datetime
 
 
+def group_tree_model(group: Type[BaseGroup]) -> Type[BaseGroup]:
+    """`group` with the nested `children` of a `/groups/tree` node, fields declared on `group` included."""
+    class GroupTree(group):  # type: ignore
+        children: List["GroupTree"] = []
+
+    GroupTree.update_forward_refs(GroupTree=GroupTree)
+    GroupTree.__name__ = GroupTree.__qualname__ = f"{group.__name__}Tree"
+    return GroupTree
+
+
 class BaseGroupCreate(SQLModel):
     name: str
     is_active: Optional[bool] = True
@@ -0,0 +1,77 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi_users.password import PasswordHelper, PasswordHelperProtocol
+
+HASHER_BUSY = HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Too many pending password checks, retry later.",
+                            headers={"Retry-After": "1"})
+
+_process_helper: Optional[PasswordHelper] = None
+
+
+def _process_call(method: str, *args: Any) -> Any:
+    # password helpers hold an unpicklable CryptContext, so every worker process builds its own
+    global _process_helper
+    if _process_helper is None:
+        _process_helper = PasswordHelper()
+    return getattr(_process_helper, method)(*args)
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification on a bounded worker pool instead of the event loop.
+    At most `max_workers + max_queue` calls are admitted at once, further calls fail fast with 503.
+    """
+
+    def __init__(self,
+                 max_workers: int = 4,
+                 max_queue: int = 64,
+                 use_processes: bool = False,
+                 password_helper: Optional[PasswordHelperProtocol] = None):
+        if use_processes and password_helper is not None:
+            raise ValueError("a custom password_helper can only run on a thread pool.")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.use_processes = use_processes
+        self.password_helper = password_helper or PasswordHelper()
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="password-hasher")
+        return self._executor
+
+    async def _run(self, method: str, *args: Any) -> Any:
+        if self._pending >= self.max_workers + self.max_queue:
+            raise HASHER_BUSY
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            if self.use_processes:
+                return await loop.run_in_executor(self.executor(), _process_call, method, *args)
+            return await loop.run_in_executor(self.executor(), getattr(self.password_helper, method), *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._run("verify_and_update", plain_password, hashed_password)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
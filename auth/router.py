@@ -1,31 +1,57 @@
-from typing import Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi_pagination import Page
 from fastapi_pagination.ext.sqlmodel import paginate
 from fastapi_users import FastAPIUsers
 from fastapi_users.authentication import AuthenticationBackend
 from pydantic import UUID4
+from sqlalchemy import Table
 from sqlmodel import select, col
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from api_toolkit.crud.delta import TRACKED, tombstone
+from api_toolkit.db.replica import read_session_depend
+from .auth import NOT_ANY_GROUP, group_tree_depths, group_tree_ids
 from .config import AuthConfigBase
+from .models import group_tree_model
+from .search import SearchMode, SearchPage, prefix_clause, fulltext_clause, after_cursor, encode_cursor
+
+# ids per IN list of the set-based subtree deletion, below the bind parameter limits of every backend
+DELETE_CHUNK_SIZE = 500
 
 
 class GroupRouter(APIRouter):
-    def __init__(self, config: AuthConfigBase, fastapi_users: FastAPIUsers, get_async_session, **kwargs):
+    def __init__(self, config: AuthConfigBase, fastapi_users: FastAPIUsers, get_async_session,
+                 get_async_read_session=None, **kwargs):
         self._get_async_session = get_async_session
+        self._get_async_read_session = read_session_depend(get_async_session, get_async_read_session)
         self._config = config
+        self._current_user = fastapi_users.current_user(active=True)
+        # filled in on the first deletion, item tables are usually declared after the router is built
+        self._dependent_columns: Optional[List[Any]] = None
+        self._group_tree = group_tree_model(config.Group)
         super().__init__(**kwargs)
 
         self.add_api_route(
             path="/",
             endpoint=self._get_all(),
             methods=["GET"],
+            response_model=Page[config.Group],  # type: ignore
             tags=config.group_tags or ["auth"],
             dependencies=[Depends(fastapi_users.current_user(active=True))],
         )
 
+        # registered ahead of `/{group_id}`, which would shadow it
+        self.add_api_route(
+            path="/tree",
+            endpoint=self._get_tree(),
+            methods=["GET"],
+            response_model=self._group_tree,
+            tags=config.group_tags or ["auth"],
+        )
+
         self.add_api_route(
             path="/{group_id}",
             endpoint=self._delete(),
@@ -51,14 +77,42 @@ class GroupRouter(APIRouter):
         )
 
     def _get_all(self):
-        async def get_all(db: AsyncSession = Depends(self._get_async_session)):
-            return (await db.exec(select(self._config.GroupDB))).all()
+        async def get_all(db: AsyncSession = Depends(self._get_async_read_session)):
+            group_db = self._config.GroupDB
+            return await paginate(db, select(group_db).order_by(col(group_db.created_at), col(group_db.id)))
 
         return get_all
 
+    def _get_tree(self):
+        async def get_tree(root_id: Optional[UUID4] = Query(None, description="default: the caller's group"),
+                           depth: Optional[int] = Query(None, ge=0, description="levels below the root"),
+                           user=Depends(self._current_user),
+                           db: AsyncSession = Depends(self._get_async_read_session)):
+            """The hierarchy under a group, read with one recursive query and assembled in one pass."""
+            if not user.group_id:
+                raise NOT_ANY_GROUP
+            group_db = self._config.GroupDB
+            if root_id:
+                await self._check_in_tree(db, user, root_id)
+            root_id = root_id or user.group_id
+            tree = group_tree_depths(group_db, root_id, depth).subquery()
+            rows = (await db.exec(select(group_db).join(tree, col(group_db.id) == tree.c.id)
+                                  .order_by(tree.c.depth, col(group_db.created_at)))).all()
+            if not rows:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
+            # parents come before their children, so each node is attached to an existing one
+            nodes: Dict[Any, Any] = {}
+            for group in rows:
+                node = nodes[group.id] = self._group_tree(**group.dict())
+                if group.id != root_id:
+                    nodes[group.parent_id].children.append(node)
+            return nodes[root_id]
+
+        return get_tree
+
     def _get_one(self):
         async def get_one(group_id: UUID4,
-                          db: AsyncSession = Depends(self._get_async_session)):
+                          db: AsyncSession = Depends(self._get_async_read_session)):
             group = await db.get(self._config.GroupDB, group_id)
             if group:
                 return group
@@ -66,15 +120,99 @@ class GroupRouter(APIRouter):
 
         return get_one
 
+    def _dependents(self) -> List[Any]:
+        """Foreign key columns of other tables pointing at a group, users included."""
+        if self._dependent_columns is None:
+            group_table: Table = self._config.GroupDB.__table__
+            self._dependent_columns = [fk.parent for table in group_table.metadata.tables.values()
+                                       if table is not group_table
+                                       for fk in table.foreign_keys if fk.column is group_table.c.id]
+        return self._dependent_columns
+
+    async def _check_in_tree(self, db: AsyncSession, user: Any, group_id: Any) -> None:
+        """Raise 403 unless `group_id` is the caller's group or one below it."""
+        if not user.group_id:
+            raise NOT_ANY_GROUP
+        if group_id == user.group_id:
+            return
+        own = group_tree_ids(self._config.GroupDB, user.group_id).subquery()
+        if not (await db.execute(select(own.c.id).where(own.c.id == group_id))).first():
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                                detail="You don't have permission to access resources of this group.")
+
+    @staticmethod
+    async def _bury_dependents(db: AsyncSession, column: Any, where: Any, subtree: List[Any],
+                               parent_id: Any) -> Dict[str, Any]:
+        """
+        Tombstones for the rows of a table served by `/delta` leaving the deleted `subtree`, the set-based
+        writes skip its listeners. Returns the values stamping the delta column, empty for other tables.
+        """
+        if column.table not in TRACKED:
+            return {}
+        timestamp, pk, tombstones = TRACKED[column.table]
+        table, deleted = column.table, set(subtree)
+        own = table.c.own_group_id if "own_group_id" in table.c else column
+        rows = (await db.execute(select(table.c[pk], own).where(where))).all()
+        if rows:
+            await db.execute(tombstones.insert(), [tombstone(table.name, item_id,
+                                                             parent_id if group_id in deleted else group_id)
+                                                   for item_id, group_id in rows])
+        return {timestamp: datetime.now()}
+
     def _delete(self):
         async def delete(group_id: UUID4,
+                         reassign_to: Optional[UUID4] = None,
+                         cascade: bool = Query(False, description="delete rows that cannot exist without the group"),
+                         user=Depends(self._current_user),
                          db: AsyncSession = Depends(self._get_async_session)):
-            group = await db.get(self._config.GroupDB, group_id)
+            """
+            Delete the group with its whole subtree. Rows referencing a deleted group move to
+            `reassign_to` when given, otherwise nullable references are cleared. Rows whose reference
+            is not nullable, such as items, make the request fail with 409 unless `cascade` is set,
+            they are then deleted in bulk, without change events. Rows of tables served by `/delta` get
+            their tombstones, filed under the parent of the group when their own group is deleted.
+            Both groups must be in the caller's subtree.
+            """
+            await self._check_in_tree(db, user, group_id)
+            if reassign_to:
+                await self._check_in_tree(db, user, reassign_to)
+            group_db = self._config.GroupDB
+            group = await db.get(group_db, group_id)
             if not group:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
-            await db.delete(group)
+            deleted = group.dict()
+            subtree = (await db.execute(group_tree_ids(group_db, group_id))).scalars().all()
+            if reassign_to and (reassign_to in subtree or not await db.get(group_db, reassign_to)):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                    detail="reassign_to must be an existing group outside the deleted subtree")
+
+            group_table = group_db.__table__
+            chunks = [subtree[start:start + DELETE_CHUNK_SIZE] for start in range(0, len(subtree), DELETE_CHUNK_SIZE)]
+            if not reassign_to and not cascade:
+                for ids in chunks:
+                    for column in self._dependents():
+                        if not column.nullable and (await db.execute(
+                                select(column).where(column.in_(ids)).limit(1))).first():
+                            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                                detail=f"{column.table.name} rows still belong to the group, "
+                                                       f"give reassign_to or cascade")
+            for ids in chunks:
+                for column in self._dependents():
+                    where = column.in_(ids)
+                    stamp = await self._bury_dependents(db, column, where, subtree, group.parent_id)
+                    if reassign_to:
+                        await db.execute(column.table.update().where(where).values({column.name: reassign_to, **stamp}))
+                    elif column.nullable:
+                        await db.execute(column.table.update().where(where).values({column.name: None, **stamp}))
+                    else:
+                        await db.execute(column.table.delete().where(where))
+                # detach the chunk first, so no backend trips over the parent_id of a not yet deleted child
+                await db.execute(group_table.update().where(group_table.c.id.in_(ids)).values(parent_id=None))
+            for ids in chunks:
+                await db.execute(group_table.delete().where(group_table.c.id.in_(ids)))
+            db.expunge(group)
             await db.commit()
-            return group
+            return deleted
 
         return delete
 
@@ -95,9 +233,11 @@ class AuthRouter(APIRouter):
                  auth_backend: AuthenticationBackend,
                  config: AuthConfigBase,
                  get_async_session,
+                 get_async_read_session=None,
                  **kwargs):
         super().__init__(**kwargs)
         self._get_async_session = get_async_session
+        self._get_async_read_session = read_session_depend(get_async_session, get_async_read_session)
         self._config = config
 
         self.include_router(
@@ -120,6 +260,15 @@ class AuthRouter(APIRouter):
         #     prefix="/auth",
         #     tags=["auth"],
         # )
+        # registered ahead of the users router so `/users/{id}` does not shadow it
+        self.add_api_route(
+            path="/users/search",
+            endpoint=self._search(),
+            methods=["GET"],
+            response_model=SearchPage[config.User],  # type: ignore
+            tags=config.user_tags or ["auth"],
+            dependencies=[Depends(fastapi_users.current_user(active=True, superuser=True))],
+        )
         self.include_router(
             fastapi_users.get_users_router(config.UserRead, config.UserUpdate),
             prefix="/users",
@@ -127,7 +276,8 @@ class AuthRouter(APIRouter):
         )
 
         self.include_router(
-            GroupRouter(config, fastapi_users, get_async_session),
+            GroupRouter(config, fastapi_users, get_async_session, get_async_read_session,
+                        route_class=self.route_class),
             prefix="/groups",
             tags=config.group_tags or ["auth"],
         )
@@ -141,10 +291,11 @@ class AuthRouter(APIRouter):
         )
 
     def _get_all(self):
-        async def get_all(db: AsyncSession = Depends(self._get_async_session),
+        async def get_all(db: AsyncSession = Depends(self._get_async_read_session),
                           username: Optional[str] = None,
                           ) -> Page[self._config.User]:  # type: ignore
             query = select(self._config.UserDB).where(self._config.UserDB.is_superuser == False)
+            # substring match as before `/users/search`, which is the indexed way to look users up
             if username:
                 query = query.where(col(self._config.UserDB.email).like(f'%{username}%').__or__(
                     col(self._config.UserDB.username).like(f'%{username}%')
@@ -152,3 +303,32 @@ class AuthRouter(APIRouter):
             return await paginate(db, query)
 
         return get_all
+
+    def _search(self):
+        async def search(q: str,
+                         mode: SearchMode = SearchMode.prefix,
+                         cursor: Optional[str] = None,
+                         limit: int = Query(50, ge=1, le=500),
+                         db: AsyncSession = Depends(self._get_async_read_session)):
+            user_db = self._config.UserDB
+            clause = None
+            if mode == SearchMode.fulltext:
+                clause = fulltext_clause(user_db, q, db.bind.dialect.name)
+            if clause is None:
+                clause = prefix_clause(user_db, q)
+            # keyset pagination on (email_normalized, id), no OFFSET and no COUNT(*)
+            query = select(user_db).where(user_db.is_superuser == False, clause)
+            if cursor:
+                try:
+                    query = query.where(after_cursor(user_db, cursor))
+                except (ValueError, TypeError):
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+            query = query.order_by(col(user_db.email_normalized), col(user_db.id)).limit(limit + 1)
+            users = (await db.exec(query)).all()
+            next_cursor = None
+            if len(users) > limit:
+                users = users[:limit]
+                next_cursor = encode_cursor(users[-1].email_normalized, users[-1].id)
+            return SearchPage[self._config.User](items=users, next_cursor=next_cursor)
+
+        return search
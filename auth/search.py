@@ -0,0 +1,120 @@
+import base64
+import json
+import uuid
+from enum import Enum
+from typing import Generic, List, Optional, Tuple, Type, TypeVar
+
+from pydantic.generics import GenericModel
+from sqlalchemy import and_, column, func, literal_column, or_, table, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import ColumnElement
+from sqlmodel import SQLModel, col, select
+
+T = TypeVar("T")
+
+# trigram / ngram indexes cannot match anything shorter than this
+MIN_FULLTEXT_TERM = 3
+
+
+class SearchMode(str, Enum):
+    prefix = "prefix"
+    fulltext = "fulltext"
+
+
+class SearchPage(GenericModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    return email.strip().lower() if email else email
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_table(user_model: Type[SQLModel]) -> str:
+    return f"{user_model.__tablename__}_fts"
+
+
+def prefix_clause(user_model: Type[SQLModel], term: str) -> ColumnElement:
+    """`LIKE 'term%'` on the indexed normalized columns, which the index can serve as a range scan."""
+    pattern = _escape_like(normalize_email(term)) + "%"
+    clauses = [col(user_model.email_normalized).like(pattern, escape="\\")]
+    if "username" in user_model.__table__.columns:
+        clauses.append(col(user_model.username).like(_escape_like(term.strip()) + "%", escape="\\"))
+    return or_(*clauses)
+
+
+def fulltext_clause(user_model: Type[SQLModel], term: str, dialect: str) -> Optional[ColumnElement]:
+    """
+    Substring match served by the n-gram index of `create_user_search_index`,
+    None when the dialect has no such index or the term is too short for it.
+    """
+    term = term.strip()
+    if len(term) < MIN_FULLTEXT_TERM:
+        return None
+    phrase = '"' + term.replace('"', '""') + '"'
+    if dialect == "sqlite":
+        fts = table(_fts_table(user_model), column("rowid"))
+        matches = select(fts.c.rowid).where(literal_column(fts.name).op("MATCH")(phrase))
+        return literal_column(f"{user_model.__tablename__}.rowid").in_(matches)
+    if dialect == "mysql":
+        return text("MATCH (email) AGAINST (:fulltext_term IN BOOLEAN MODE)").bindparams(fulltext_term=phrase)
+    return None
+
+
+def encode_cursor(email_normalized: str, id_: uuid.UUID) -> str:
+    raw = json.dumps([email_normalized, str(id_)]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, uuid.UUID]:
+    email_normalized, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return email_normalized, uuid.UUID(id_)
+
+
+def after_cursor(user_model: Type[SQLModel], cursor: str) -> ColumnElement:
+    email_normalized, id_ = decode_cursor(cursor)
+    return or_(col(user_model.email_normalized) > email_normalized,
+               and_(col(user_model.email_normalized) == email_normalized, col(user_model.id) > id_))
+
+
+def create_user_search_index(connection: Connection, user_model: Type[SQLModel], fulltext: bool = False) -> None:
+    """
+    Backfill `email_normalized` for rows written before it existed and, with `fulltext`,
+    create the n-gram index used by `SearchMode.fulltext`:
+    a trigram FTS5 table kept in sync by triggers on SQLite, an ngram FULLTEXT index on MySQL.
+    Safe to run on every startup on SQLite, run it once (as a migration) on MySQL.
+    """
+    table_ = user_model.__table__
+    connection.execute(table_.update().where(table_.c.email_normalized.is_(None)).values(
+        email_normalized=func.lower(func.trim(table_.c.email))))
+    if not fulltext:
+        return
+
+    name = _quote(connection, table_.name)
+    if connection.dialect.name == "sqlite":
+        fts = _fts_table(user_model)
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} "
+            f"USING fts5(email, content={name}, content_rowid='rowid', tokenize='trigram')"))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {name} BEGIN "
+            f"INSERT INTO {fts}(rowid, email) VALUES (new.rowid, new.email); END"))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {name} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, email) VALUES ('delete', old.rowid, old.email); END"))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF email ON {name} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, email) VALUES ('delete', old.rowid, old.email); "
+            f"INSERT INTO {fts}(rowid, email) VALUES (new.rowid, new.email); END"))
+        connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+    elif connection.dialect.name == "mysql":
+        connection.execute(text(
+            f"ALTER TABLE {name} ADD FULLTEXT INDEX ix_{table_.name}_email_ft (email) WITH PARSER ngram"))
+
+
+def _quote(connection: Connection, name: str) -> str:
+    return connection.dialect.identifier_preparer.quote(name)
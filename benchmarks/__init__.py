@@ -0,0 +1,7 @@
+"""
+Benchmarks of the generated routers and of import time, run them as modules, e.g.
+
+    python -m api_toolkit.benchmarks.routes --concurrency 16 --out routes.json
+    python -m api_toolkit.benchmarks.login_storm --out login_storm.json
+    python -m api_toolkit.benchmarks.import_time --max-ms 1500
+"""
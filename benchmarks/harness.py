@@ -0,0 +1,87 @@
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT
+
+REQUEST_FUNC = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class QueryCounter:
+    """
+    Counts the statements sent through the given engines (sync, or the `sync_engine` of async ones)
+    and those of them served from the compiled cache.
+    """
+
+    def __init__(self, *engines: Any):
+        self.count = 0
+        self.compile_cache_hits = 0
+        for engine in engines:
+            event.listen(getattr(engine, "sync_engine", engine), "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.count += 1
+        if getattr(context, "cache_hit", None) is CACHE_HIT:
+            self.compile_cache_hits += 1
+
+    def reset(self) -> None:
+        self.count = 0
+        self.compile_cache_hits = 0
+
+
+def client(app: Any) -> httpx.AsyncClient:
+    return httpx.AsyncClient(app=app, base_url="http://bench")
+
+
+async def measure(http: httpx.AsyncClient, request: REQUEST_FUNC,
+                  total: int, concurrency: int, queries: Optional[QueryCounter] = None) -> Dict[str, Any]:
+    """Send `total` requests with at most `concurrency` in flight and summarize their latency."""
+    if queries:
+        queries.reset()
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            response = await request(http, i)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    result = {
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "statuses": statuses,
+    }
+    if queries:
+        result["queries_per_request"] = round(queries.count / total, 2) if total else 0.0
+        result["compile_cache_hit_rate"] = round(queries.compile_cache_hits / queries.count, 4) \
+            if queries.count else 0.0
+    return result
+
+
+def write_results(results: Dict[str, Any], out: Optional[str]) -> None:
+    text = json.dumps(results, indent=2, default=str)
+    if out:
+        with open(out, "w") as file:
+            file.write(text)
+    print(text)
@@ -0,0 +1,77 @@
+"""
+Cold import time of each toolkit entry point, measured in fresh interpreters, and the heavy
+optional dependencies each one drags in. Exits non-zero when an entry point loads a dependency
+it must not need, or when `--max-ms` is exceeded, so it can guard cold-start latency in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+HEAVY = ["fastapi_users", "bcrypt", "passlib", "cryptography", "jwt", "graphviz"]
+
+# entry point -> heavy modules it must not import
+ENTRY_POINTS: Dict[str, List[str]] = {
+    "api_toolkit": HEAVY,
+    "api_toolkit.crud": HEAVY,
+    "api_toolkit.db": HEAVY,
+    "api_toolkit.state_item": HEAVY,
+    "api_toolkit.auth": ["graphviz"],
+}
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module: str, runs: int) -> Dict[str, Any]:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in sys.path if p))
+    samples, loaded = [], []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                                capture_output=True, text=True, env=env, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["ms"])
+        loaded = result["loaded"]
+    return {
+        "median_ms": round(statistics.median(samples), 2),
+        "min_ms": round(min(samples), 2),
+        "max_ms": round(max(samples), 2),
+        "heavy_modules_loaded": loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail when a median exceeds this")
+    parser.add_argument("--out", default=None, help="write the JSON results to this file")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {}
+    failures: List[str] = []
+    for module, forbidden in ENTRY_POINTS.items():
+        results[module] = result = probe(module, args.runs)
+        unexpected = sorted(set(result["heavy_modules_loaded"]) & set(forbidden))
+        if unexpected:
+            failures.append(f"{module} imports {', '.join(unexpected)}")
+        if args.max_ms is not None and result["median_ms"] > args.max_ms:
+            failures.append(f"{module} takes {result['median_ms']}ms to import, limit is {args.max_ms}ms")
+
+    text = json.dumps({"imports": results, "failures": failures}, indent=2)
+    if args.out:
+        with open(args.out, "w") as file:
+            file.write(text)
+    print(text)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
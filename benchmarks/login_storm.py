@@ -0,0 +1,104 @@
+"""
+Latency of an unrelated route while a burst of logins is being verified,
+with password hashing on the event loop (`--inline`) or on the `PasswordHasher` pool.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+
+from fastapi import Depends, FastAPI
+from fastapi_users.password import PasswordHelper
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from api_toolkit.auth import AuthFactory, PasswordHasher
+
+from .harness import client, measure, write_results
+from .models import AuthConfig
+
+
+class InlineHasher(PasswordHasher):
+    """Hashes on the calling thread, i.e. the behaviour without a worker pool."""
+
+    async def _run(self, method, *args):
+        return getattr(self.password_helper, method)(*args)
+
+
+def make_app(url: str, hasher: PasswordHasher):
+    engine = create_async_engine(url)
+    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def get_async_session():
+        async with async_session() as session:
+            yield session
+
+    auth = AuthFactory(AuthConfig)(get_async_session, "bench-secret", password_hasher=hasher)
+    app = FastAPI()
+    app.include_router(auth.router)
+
+    @app.get("/ping")
+    async def ping(user=Depends(auth.current_user)):
+        return {"id": user.id}
+
+    return app, engine
+
+
+async def run(args) -> dict:
+    hasher = InlineHasher() if args.inline else PasswordHasher(max_workers=args.workers,
+                                                               max_queue=args.queue)
+    with tempfile.TemporaryDirectory() as tmp:
+        app, engine = make_app(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}", hasher)
+        async with engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda sync: sync.execute(AuthConfig.UserDB.__table__.insert(), [{
+                "id": "00000000000000000000000000000001", "email": "bench@example.com",
+                "hashed_password": PasswordHelper().hash("bench-password"),
+                "is_active": True, "is_superuser": False, "is_verified": True,
+            }]))
+
+        credentials = {"username": "bench@example.com", "password": "bench-password"}
+        async with client(app) as http:
+            token = (await http.post("/auth/jwt/login", data=credentials)).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            async def login(http, i):
+                return await http.post("/auth/jwt/login", data=credentials)
+
+            async def ping(http, i):
+                return await http.get("/ping", headers=headers)
+
+            baseline = await measure(http, ping, args.probes, args.probe_concurrency)
+            storm, under_storm = await asyncio.gather(
+                measure(http, login, args.logins, args.login_concurrency),
+                measure(http, ping, args.probes, args.probe_concurrency),
+            )
+        await engine.dispose()
+    hasher.shutdown()
+    return {
+        "hasher": "inline" if args.inline else f"pool({args.workers}, queue={args.queue})",
+        "ping_idle": baseline,
+        "ping_during_login_storm": under_storm,
+        "login_storm": storm,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--inline", action="store_true", help="hash on the event loop")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue", type=int, default=64)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=50)
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--probe-concurrency", type=int, default=4)
+    parser.add_argument("--out", default=None, help="write the JSON results to this file")
+    args = parser.parse_args()
+    write_results(asyncio.run(run(args)), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+from api_toolkit.auth.config import AuthConfigBase
+from api_toolkit.auth.item.models import AuthItemBase
+from api_toolkit.auth.models import BaseGroupDB, BaseUserDB
+from api_toolkit.state_item import StateBase, StateItemBase
+
+
+class AuthConfig(AuthConfigBase):
+    class UserDB(BaseUserDB, table=True):
+        pass
+
+    class GroupDB(BaseGroupDB, table=True):
+        pass
+
+
+class Item(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True)
+    price: int = Field(default=0, index=True)
+
+
+class ItemCreate(SQLModel):
+    name: str
+    price: int = 0
+
+
+class Home(AuthItemBase, table=True):
+    pos: str
+
+
+class HomeCreate(SQLModel):
+    pos: str
+
+
+class ProductState(StateBase):
+    Order = 1
+    Produce = 2
+    Shipped = 3
+
+
+class ProductCreate(SQLModel):
+    name: str
+
+
+class Product(StateItemBase, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    state: ProductState = Field(index=True, default=ProductState.Order)
+    name: str
+    factory_id: Optional[int] = None
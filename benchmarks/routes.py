@@ -0,0 +1,185 @@
+"""
+Throughput, latency and queries per request of every generated route of SQLModelCRUDRouter,
+AuthCRUDRouter (for a user owning a deep and a wide synthetic group tree) and StateItemCRUDRouter,
+served from a SQLite file and driven through an in-process ASGI client.
+"""
+import argparse
+import asyncio
+import os
+import platform
+import tempfile
+import uuid
+from typing import Any, Callable, Dict, List
+
+from fastapi import FastAPI
+from fastapi_pagination import add_pagination
+from fastapi_users.password import PasswordHelper
+from sqlmodel import SQLModel
+
+from api_toolkit.auth import AuthFactory
+from api_toolkit.auth.item.router import AuthCRUDRouter
+from api_toolkit.crud import SQLModelCRUDRouter
+from api_toolkit.db import AsyncSessionProvider, SessionProvider
+from api_toolkit.state_item import StateItemCRUDRouter, StatusRegistrar
+
+from .harness import QueryCounter, client, measure, write_results
+from .models import AuthConfig, Home, HomeCreate, Item, ItemCreate, Product, ProductCreate, ProductState
+
+PASSWORD = "bench-password"
+
+
+def order_to_produce(self, factory_id: int):
+    self.factory_id = factory_id
+
+
+def make_app(path: str, coalesce_reads: bool = False):
+    db = SessionProvider(f"sqlite:///{path}", pool_size=20, max_overflow=20)
+    async_db = AsyncSessionProvider(f"sqlite+aiosqlite:///{path}", pool_size=20, max_overflow=20)
+    SQLModel.metadata.create_all(db.engine)
+
+    app = FastAPI()
+    auth = AuthFactory(AuthConfig)(async_db, "bench-secret")
+    app.include_router(auth.router)
+    app.include_router(SQLModelCRUDRouter(db_func=db, db_model=Item, create_schema=ItemCreate,
+                                          filter_fields=["name"], order_fields=["price"],
+                                          coalesce_reads=coalesce_reads))
+    app.include_router(AuthCRUDRouter(auth=auth, db_func=db, db_model=Home, create_schema=HomeCreate,
+                                      coalesce_reads=coalesce_reads))
+
+    registrar = StatusRegistrar(db, app)
+    registrar.register(ProductState.Order, ProductState.Produce, "make product")(order_to_produce)
+    registrar.bind(ProductState, Product)
+    app.include_router(StateItemCRUDRouter(registrar=registrar, db_func=db, db_model=Product,
+                                           create_schema=ProductCreate, coalesce_reads=coalesce_reads))
+    add_pagination(app)
+    return app, db, async_db
+
+
+def seed(db: SessionProvider, args) -> Dict[str, Any]:
+    """Insert the rows every scenario reads, updates and deletes, returns their ids."""
+    group_table = AuthConfig.GroupDB.__table__
+    deep = [uuid.uuid4() for _ in range(args.deep)]
+    wide_root, wide = uuid.uuid4(), [uuid.uuid4() for _ in range(args.wide)]
+    groups = [{"id": g, "name": f"deep-{i}", "parent_id": deep[i - 1] if i else None, "is_active": True}
+              for i, g in enumerate(deep)]
+    groups.append({"id": wide_root, "name": "wide", "parent_id": None, "is_active": True})
+    groups += [{"id": g, "name": f"wide-{i}", "parent_id": wide_root, "is_active": True} for i, g in enumerate(wide)]
+
+    hashed = PasswordHelper().hash(PASSWORD)
+    users = [{"id": uuid.uuid4(), "email": f"{name}@bench.example", "email_normalized": f"{name}@bench.example",
+              "hashed_password": hashed, "group_id": root, "is_active": True, "is_superuser": False,
+              "is_verified": True} for name, root in (("deep", deep[0]), ("wide", wide_root))]
+
+    count = args.items
+    homes: Dict[str, List[uuid.UUID]] = {"deep": [], "wide": []}
+    home_rows = []
+    for tree, tree_groups in (("deep", deep), ("wide", wide)):
+        for i in range(count * 2):
+            home_id = uuid.uuid4()
+            homes[tree].append(home_id)
+            home_rows.append({"id": home_id, "own_group_id": tree_groups[i % len(tree_groups)], "pos": f"{i}"})
+
+    with db.engine.begin() as conn:
+        conn.execute(group_table.insert(), groups)
+        conn.execute(AuthConfig.UserDB.__table__.insert(), users)
+        conn.execute(Home.__table__.insert(), home_rows)
+        conn.execute(Item.__table__.insert(), [{"name": f"item-{i}", "price": i} for i in range(count * 2)])
+        conn.execute(Product.__table__.insert(), [
+            {"name": f"product-{i}", "state": ProductState.Order} for i in range(count * 2)
+        ])
+    return {"homes": homes, "deep": deep, "wide": wide, "items": count}
+
+
+def scenarios(ids: Dict[str, Any], tokens: Dict[str, Dict[str, str]]) -> Dict[str, Callable]:
+    """Route name -> request function, `i` picks a distinct row so writes never collide."""
+    n = ids["items"]
+    routes: Dict[str, Callable] = {
+        "crud:get_all": lambda http, i: http.get("/item", params={"size": 50}),
+        "crud:get_all_ordered": lambda http, i: http.get("/item", params={"order": "-price", "page": i % 5 + 1}),
+        "crud:get_all_filtered": lambda http, i: http.get("/item", params={"filter_by": "name",
+                                                                           "filter_value": f"item-{i % n}"}),
+        "crud:get_one": lambda http, i: http.get(f"/item/{i % n + 1}"),
+        "crud:get_many": lambda http, i: http.post("/item/_mget", json={"ids": [
+            (i + k) % n + 1 for k in range(50)]}),
+        "crud:create": lambda http, i: http.post("/item", json={"name": f"new-{i}", "price": i}),
+        "crud:update": lambda http, i: http.put(f"/item/{i % n + 1}", json={"name": f"upd-{i}", "price": i}),
+        "crud:delete_one": lambda http, i: http.delete(f"/item/{n + i % n + 1}"),
+        "state:get_all_in_state": lambda http, i: http.get("/product/", params={"state": 1}),
+        "state:get_one": lambda http, i: http.get(f"/product/{i % n + 1}"),
+        "state:transition": lambda http, i: http.post("/product/transition/Order-to-Produce",
+                                                      params={"item_id": i % n + 1, "factory_id": 1}),
+    }
+    for tree in ("deep", "wide"):
+        headers = tokens[tree]
+        homes = ids["homes"][tree]
+        groups = ids[tree]
+        routes.update({
+            f"auth_{tree}:get_all": lambda http, i, h=headers: http.get("/home", headers=h),
+            f"auth_{tree}:get_one": lambda http, i, h=headers, homes=homes: http.get(
+                f"/home/{homes[i % n]}", headers=h),
+            f"auth_{tree}:get_many": lambda http, i, h=headers, homes=homes: http.post(
+                "/home/_mget", json={"ids": [str(homes[(i + k) % n]) for k in range(50)]}, headers=h),
+            f"auth_{tree}:create": lambda http, i, h=headers, g=groups: http.post(
+                "/home", params={"group_id": str(g[-1])}, json={"pos": f"new-{i}"}, headers=h),
+            f"auth_{tree}:update": lambda http, i, h=headers, homes=homes, g=groups: http.put(
+                f"/home/{homes[i % n]}", json={"pos": f"upd-{i}", "own_group_id": str(g[i % len(g)])}, headers=h),
+            f"auth_{tree}:change_owner": lambda http, i, h=headers, homes=homes, g=groups: http.post(
+                f"/home/{homes[i % n]}/change_owner", params={"group_id": str(g[i % len(g)])}, headers=h),
+            f"auth_{tree}:delete_one": lambda http, i, h=headers, homes=homes: http.delete(
+                f"/home/{homes[n + i % n]}", headers=h),
+        })
+    return routes
+
+
+async def run(args) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        app, db, async_db = make_app(os.path.join(tmp, "bench.db"), args.coalesce)
+        ids = seed(db, args)
+        queries = QueryCounter(db.engine, async_db.engine)
+        results: Dict[str, Any] = {
+            "meta": {
+                "python": platform.python_version(),
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "items": args.items,
+                "deep_groups": args.deep,
+                "wide_groups": args.wide,
+                "coalesce_reads": args.coalesce,
+            },
+            "routes": {},
+        }
+        async with client(app) as http:
+            tokens = {}
+            for tree in ("deep", "wide"):
+                response = await http.post("/auth/jwt/login",
+                                           data={"username": f"{tree}@bench.example", "password": PASSWORD})
+                tokens[tree] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            for name, request in scenarios(ids, tokens).items():
+                if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                    continue
+                total = min(args.requests, args.items) if "delete" in name or "transition" in name \
+                    else args.requests
+                results["routes"][name] = await measure(http, request, total, args.concurrency, queries)
+        results["pool"] = {"sync": db.pool_stats(), "async": async_db.pool_stats()}
+        db.dispose()
+        await async_db.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--items", type=int, default=500, help="seeded rows per table and tree")
+    parser.add_argument("--deep", type=int, default=200, help="depth of the deep group chain")
+    parser.add_argument("--wide", type=int, default=2000, help="children of the wide group tree root")
+    parser.add_argument("--coalesce", action="store_true", help="build the routers with coalesce_reads")
+    parser.add_argument("--only", nargs="*", help="route name prefixes to run, e.g. crud: auth_deep:get")
+    parser.add_argument("--out", default=None, help="write the JSON results to this file")
+    args = parser.parse_args()
+    write_results(asyncio.run(run(args)), args.out)
+
+
+if __name__ == "__main__":
+    main()
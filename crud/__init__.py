@@ -1,5 +1,16 @@
+from .admission import AdmissionControl, RouteClass
+from .changes import Broadcaster, BroadcastBackend, ChangeEvent, MemoryBackend, RedisBackend
 from .crud import SQLModelCRUDRouter
+from .encoding import ResponseEncoding
 
 __all__ = [
-    'SQLModelCRUDRouter'
+    'SQLModelCRUDRouter',
+    'AdmissionControl',
+    'RouteClass',
+    'Broadcaster',
+    'BroadcastBackend',
+    'ChangeEvent',
+    'MemoryBackend',
+    'RedisBackend',
+    'ResponseEncoding',
 ]
@@ -0,0 +1,161 @@
+import asyncio
+from collections import deque
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from api_toolkit.db.instrument import render_prometheus
+
+# (requests executing at once, requests waiting for a slot beyond those)
+LIMIT = Tuple[int, int]
+
+
+class RouteClass(str, Enum):
+    read = "read"
+    write = "write"
+    transition = "transition"
+    export = "export"
+    # long-lived responses such as the `/changes` feed, not limited unless a limit is given
+    stream = "stream"
+
+
+class _Gate:
+    def __init__(self, route_class: str, concurrency: int, queue: int):
+        self.route_class = route_class
+        self.concurrency = concurrency
+        self.queue = queue
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def acquire(self, max_wait: float) -> bool:
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self.waiters) >= self.queue:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            # `release` hands its slot over by resolving the waiter, `active` is unchanged then
+            await asyncio.wait_for(waiter, max_wait)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            return False
+        except asyncio.CancelledError:
+            # the client went away, a slot handed over meanwhile moves on to the next waiter
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionControl:
+    """
+    Concurrency limits per route class, checked on the event loop before a route takes a
+    threadpool worker or a pooled connection. Up to `concurrency` requests of a class execute,
+    up to `queue` more wait at most `max_wait` seconds for a slot, any other request is answered
+    503 with `Retry-After` right away. Classes without a limit are not gated.
+
+        admission = AdmissionControl(read=(32, 64), write=(8, 16), export=(2, 0))
+        SQLModelCRUDRouter(..., admission=admission)
+
+    One instance shared by several routers limits their routes of each class together.
+    """
+
+    def __init__(self,
+                 read: Optional[LIMIT] = None,
+                 write: Optional[LIMIT] = None,
+                 transition: Optional[LIMIT] = None,
+                 export: Optional[LIMIT] = None,
+                 stream: Optional[LIMIT] = None,
+                 max_wait: float = 5,
+                 retry_after: int = 1):
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.gates: Dict[str, _Gate] = {}
+        for route_class, limit in ((RouteClass.read, read), (RouteClass.write, write),
+                                   (RouteClass.transition, transition), (RouteClass.export, export),
+                                   (RouteClass.stream, stream)):
+            if limit is None:
+                continue
+            concurrency, queue = limit
+            if concurrency < 1 or queue < 0:
+                raise ValueError(f"admission limit of {route_class.value} needs concurrency >= 1 and queue >= 0.")
+            self.gates[route_class.value] = _Gate(route_class.value, concurrency, queue)
+
+    def dependency(self, route_class: str) -> Optional[Callable[..., AsyncIterator[None]]]:
+        """Route dependency holding a slot of `route_class` for the request, None when it is not limited."""
+        gate = self.gates.get(RouteClass(route_class).value)
+        if gate is None:
+            return None
+
+        async def admit() -> AsyncIterator[None]:
+            if not await gate.acquire(self.max_wait):
+                raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    f"Too many concurrent {gate.route_class} requests, retry later.",
+                                    headers={"Retry-After": str(self.retry_after)})
+            try:
+                yield
+            finally:
+                gate.release()
+
+        return admit
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "concurrency": gate.concurrency,
+                "queue": gate.queue,
+                "active": gate.active,
+                "queued": len(gate.waiters),
+                "admitted": gate.admitted,
+                "rejected": gate.rejected,
+                "timed_out": gate.timed_out,
+            }
+            for name, gate in self.gates.items()
+        }
+
+    def prometheus(self) -> str:
+        families: Dict[str, List[str]] = {
+            "api_toolkit_admission_active gauge Requests executing per route class.": [],
+            "api_toolkit_admission_queued gauge Requests waiting for a slot per route class.": [],
+            "api_toolkit_admission_admitted_total counter Requests admitted per route class.": [],
+            "api_toolkit_admission_rejected_total counter Requests answered 503 per route class and reason.": [],
+        }
+        active, queued, admitted, rejected = families.values()
+        for name, gate in sorted(self.gates.items()):
+            label = f'route_class="{name}"'
+            active.append(f"{{{label}}} {gate.active}")
+            queued.append(f"{{{label}}} {len(gate.waiters)}")
+            admitted.append(f"{{{label}}} {gate.admitted}")
+            rejected.append(f'{{{label},reason="queue_full"}} {gate.rejected}')
+            rejected.append(f'{{{label},reason="timeout"}} {gate.timed_out}')
+
+        return render_prometheus(families)
+
+    def metrics_route(self):
+        """Endpoint serving `prometheus()`, e.g. `app.add_api_route("/admission", admission.metrics_route())`."""
+
+        async def metrics() -> PlainTextResponse:
+            return PlainTextResponse(self.prometheus(), media_type="text/plain; version=0.0.4")
+
+        return metrics
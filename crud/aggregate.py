@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import Column
+
+# group rows returned by one `/aggregate` call, `truncated` is set when there are more
+AGGREGATE_MAX_GROUPS = 1000
+
+FUNCTIONS = ("sum", "min", "max")
+
+
+class AggregateRow(BaseModel):
+    group: Dict[str, Any] = {}
+    count: int
+    sum: Dict[str, Any] = {}
+    min: Dict[str, Any] = {}
+    max: Dict[str, Any] = {}
+
+
+class Aggregate(BaseModel):
+    rows: List[AggregateRow]
+    truncated: bool = False
+
+
+def summable(column: Column) -> bool:
+    try:
+        return column.type.python_type in (int, float, Decimal)
+    except NotImplementedError:
+        return False
+
+
+class TTLCache:
+    """Results kept for `ttl` seconds, at most `max_entries` of them, least recently stored evicted first."""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -4,12 +4,21 @@ from typing import Any, Callable, Generic, List, Optional, Type, Union
 from fastapi import APIRouter, HTTPException
 from fastapi.types import DecoratedCallable
 from fastapi_pagination import Page
+from pydantic.generics import GenericModel
 
 from .types import T, DEPENDENCIES
 from .utils import schema_factory
 
 NOT_FOUND = HTTPException(404, "Item not found")
 
+GET_MANY_LIMIT = 1000
+
+
+class ItemsByIds(GenericModel, Generic[T]):
+    """Items in the order their ids were requested, `None` (and listed in `missing`) where not found."""
+    items: List[Optional[T]]
+    missing: List[Any]
+
 
 class CRUDGenerator(Generic[T], APIRouter, ABC):
     schema: Type[T]
@@ -30,6 +39,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
             update_route: Union[bool, DEPENDENCIES] = True,
             delete_one_route: Union[bool, DEPENDENCIES] = True,
             delete_all_route: Union[bool, DEPENDENCIES] = True,
+            get_many_route: Union[bool, DEPENDENCIES] = True,
             **kwargs: Any,
     ) -> None:
         self._pk: str = self._pk if hasattr(self, "_pk") else "id"
@@ -59,6 +69,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
                 response_model=Page[self.schema],  # type: ignore
                 summary="Get All",
                 dependencies=get_all_route,
+                coalesce=True,
             )
 
         if create_route:
@@ -81,6 +92,25 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
                 dependencies=delete_all_route,
             )
 
+        if get_many_route:
+            # registered ahead of "/{item_id}", which would otherwise capture "/_mget"
+            self._add_api_route(
+                "/_mget",
+                self._get_many(),
+                methods=["GET"],
+                response_model=ItemsByIds[self.schema],  # type: ignore
+                summary="Get Many",
+                dependencies=get_many_route,
+            )
+            self._add_api_route(
+                "/_mget",
+                self._get_many(in_body=True),
+                methods=["POST"],
+                response_model=ItemsByIds[self.schema],  # type: ignore
+                summary="Get Many (ids in body)",
+                dependencies=get_many_route,
+            )
+
         if get_one_route:
             self._add_api_route(
                 "/{item_id}",
@@ -90,6 +120,7 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
                 summary="Get One",
                 dependencies=get_one_route,
                 error_responses=[NOT_FOUND],
+                coalesce=True,
             )
 
         if update_route:
@@ -120,8 +151,10 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
             endpoint: Callable[..., Any],
             dependencies: Union[bool, DEPENDENCIES],
             error_responses: Optional[List[HTTPException]] = None,
+            coalesce: bool = False,
             **kwargs: Any,
     ) -> None:
+        # `coalesce` marks idempotent reads whose concurrent calls may be shared, see SQLModelCRUDRouter
         dependencies = [] if isinstance(dependencies, bool) else dependencies
         responses: Any = (
             {err.status_code: {"detail": err.detail} for err in error_responses}
@@ -183,6 +216,10 @@ class CRUDGenerator(Generic[T], APIRouter, ABC):
     def _get_one(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
         raise NotImplementedError
 
+    @abstractmethod
+    def _get_many(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
+        raise NotImplementedError
+
     @abstractmethod
     def _create(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
         raise NotImplementedError
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+
+import anyio.from_thread
+from fastapi import Request
+from pydantic import BaseModel
+
+logger = logging.getLogger("api_toolkit.changes")
+
+MATCH = Optional[Callable[["ChangeEvent"], bool]]
+
+
+class ChangeEvent(BaseModel):
+    topic: str
+    action: str
+    id: Any = None
+    group_id: Optional[str] = None
+    previous_group_id: Optional[str] = None
+    state: Any = None
+    previous_state: Any = None
+    data: Any = None
+
+
+class BroadcastBackend(ABC):
+    """Carries published events between processes, every process receives every message of the channel."""
+
+    async def connect(self) -> None:
+        pass
+
+    async def disconnect(self) -> None:
+        pass
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def subscribe(self, channel: str) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+
+class MemoryBackend(BroadcastBackend):
+    """
+    Local stand-in for a cross-process backend: broadcasters sharing one instance
+    see each other's events the way processes sharing a Redis server do.
+    """
+
+    def __init__(self):
+        self._queues: Dict[str, List[asyncio.Queue]] = defaultdict(list)
+
+    async def publish(self, channel: str, message: str) -> None:
+        for queue in list(self._queues[channel]):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._queues[channel].append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues[channel].remove(queue)
+
+
+class RedisBackend(BroadcastBackend):
+    """Redis pub/sub, needs the `redis` package (4.2 or later)."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._redis: Any = None
+
+    async def connect(self) -> None:
+        from redis import asyncio as aioredis
+
+        self._redis = aioredis.from_url(self.url)
+
+    async def disconnect(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self._redis.publish(channel, message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["data"].decode()
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+
+
+class _Subscriber:
+    def __init__(self, topic: str, queue_size: int):
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+
+
+class LoopBound:
+    """
+    Base of the objects living on one event loop, captured by `_bind`. Events reach them through
+    `_call_soon` from the loop itself, from the threadpool running sync endpoints, or from any other
+    thread once bound.
+    """
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind(self) -> None:
+        # runs on the event loop
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+
+    def _call_soon(self, callback: Callable[..., None], *args: Any) -> bool:
+        """Run `callback(*args)` on the loop, False when there is none to run it on."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            callback(*args)
+            return True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(callback, *args)
+            return True
+        try:
+            anyio.from_thread.run_sync(callback, *args)
+        except RuntimeError:
+            return False
+        return True
+
+
+class Broadcaster(LoopBound):
+    """
+    Fans change events out to the `/changes` streams of this process, through `backend` to those of
+    every process when one is given. `publish` can be called from sync routes running in the threadpool.
+    A subscriber more than `queue_size` events behind is closed with an `overflow` event and has to resync.
+    With a backend, call `start()` on startup so events published before the first subscriber are not lost.
+    """
+
+    def __init__(self,
+                 backend: Optional[BroadcastBackend] = None,
+                 channel: str = "api_toolkit.changes",
+                 queue_size: int = 1000,
+                 keepalive: float = 15):
+        self.backend = backend
+        self.channel = channel
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self._subscribers: Set[_Subscriber] = set()
+        self._listener: Optional[asyncio.Task] = None
+        self._connected: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        self._bind()
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+            if self.backend:
+                await self.backend.disconnect()
+        self._loop = None
+
+    def _bind(self) -> None:
+        super()._bind()
+        if self.backend and self._listener is None:
+            self._connected = asyncio.Event()
+            self._listener = self._loop.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        await self.backend.connect()
+        self._connected.set()
+        async for message in self.backend.subscribe(self.channel):
+            self._deliver(message)
+
+    async def _publish_backend(self, message: str) -> None:
+        await self._connected.wait()
+        await self.backend.publish(self.channel, message)
+
+    def _dispatch(self, message: str) -> None:
+        # runs on the event loop
+        self._bind()
+        if self.backend:
+            self._loop.create_task(self._publish_backend(message))
+        else:
+            self._deliver(message)
+
+    def publish(self, event: ChangeEvent) -> None:
+        message = event.json()
+        if not self._call_soon(self._dispatch, message):
+            logger.warning("change event dropped, the broadcaster is not started: %s", message)
+
+    def _deliver(self, message: str) -> None:
+        event = ChangeEvent.parse_raw(message)
+        for subscriber in list(self._subscribers):
+            if subscriber.topic != event.topic:
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(None)
+                self._subscribers.discard(subscriber)
+
+    async def stream(self, request: Request, topic: str, match: MATCH = None) -> AsyncIterator[str]:
+        """Server-Sent Events of `topic` accepted by `match`, with a comment line every `keepalive` seconds."""
+        self._bind()
+        subscriber = _Subscriber(topic, self.queue_size)
+        self._subscribers.add(subscriber)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    yield "event: overflow\ndata: {}\n\n"
+                    return
+                if match is None or match(event):
+                    yield f"event: {event.action}\ndata: {event.json()}\n\n"
+        finally:
+            self._subscribers.discard(subscriber)
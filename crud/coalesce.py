@@ -0,0 +1,101 @@
+import asyncio
+import functools
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import serialize_response
+from fastapi.utils import create_cloned_field, create_response_field
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ClauseElement
+
+from api_toolkit.db.replica import pinned_to_primary
+from .encoding import current_media_type, render
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share the execution started by the first one.
+    The key is forgotten once that execution finishes, so nothing is served from a past result.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.executed += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here, followers may not exist
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+def scope_key(value: Any) -> Hashable:
+    # scopes resolved by dependencies, e.g. the group subquery of AuthCRUDRouter, compare by SQL and binds
+    if isinstance(value, ClauseElement):
+        compiled = value.compile()
+        return compiled.string, tuple(sorted((k, str(v)) for k, v in compiled.params.items()))
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def coalesce(flight: SingleFlight, endpoint: Callable[..., Any], response_model: Optional[Any] = None
+             ) -> Callable[..., Any]:
+    """
+    Wrap a read endpoint so identical concurrent requests (method, path, query string, resolved
+    scope and whether the request is pinned to the primary) share one execution and one body,
+    filtered through `response_model` and encoded once by the first request in the media type
+    negotiated for it (see `ResponseEncoding`).
+    """
+    signature = inspect.signature(endpoint)
+    # the route returns the body itself, so it applies the response model the way FastAPI would
+    field = create_cloned_field(create_response_field(name=f"Response_{endpoint.__name__}", type_=response_model)) \
+        if response_model is not None else None
+
+    async def execute(media_type: str, kwargs: Dict[str, Any]) -> bytes:
+        if asyncio.iscoroutinefunction(endpoint):
+            result = await endpoint(**kwargs)
+        else:
+            result = await run_in_threadpool(endpoint, **kwargs)
+        content = await serialize_response(field=field, response_content=result, is_coroutine=False)
+        return await run_in_threadpool(render, media_type, content)
+
+    @functools.wraps(endpoint)
+    async def route(coalesce_request: Request, **kwargs: Any) -> Response:
+        scope = tuple(sorted((name, scope_key(value)) for name, value in kwargs.items()
+                             if not isinstance(value, Session)))
+        media_type = current_media_type()
+        # a client pinned to the primary after a write must not join a replica read
+        key = (coalesce_request.method, coalesce_request.url.path,
+               tuple(sorted(coalesce_request.query_params.multi_items())), scope, media_type,
+               pinned_to_primary(coalesce_request))
+        body = await flight.do(key, functools.partial(execute, media_type, kwargs))
+        return Response(body, media_type=media_type)
+
+    route.__signature__ = signature.replace(parameters=[  # type: ignore
+        *signature.parameters.values(),
+        inspect.Parameter("coalesce_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+    ])
+    return route
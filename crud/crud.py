@@ -1,13 +1,33 @@
+import json
+import logging
+import warnings
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import Any, Callable, List, Type, Optional, Union, Generator
+from typing import Any, Callable, Dict, List, Set, Tuple, Type, Optional, Union, Generator
 
 from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlmodel import paginate
-from fastapi import Depends
-from sqlalchemy import text
-
-from .base import CRUDGenerator, NOT_FOUND
+from fastapi import Body, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import UniqueConstraint, func, text
+from sqlalchemy.sql import ColumnElement, Select
+from sqlalchemy.exc import SQLAlchemyError
+
+from api_toolkit.db.instrument import QueryInstrumentation
+from api_toolkit.db.replica import read_session_depend, pin_primary_depend
+from .admission import AdmissionControl, RouteClass
+from .aggregate import AGGREGATE_MAX_GROUPS, FUNCTIONS, Aggregate, AggregateRow, TTLCache, summable
+from .base import CRUDGenerator, NOT_FOUND, GET_MANY_LIMIT, ItemsByIds
 from . import utils
+from .changes import MATCH, Broadcaster, ChangeEvent
+from .coalesce import SingleFlight, coalesce as coalesce_endpoint, scope_key
+from .delta import Delta, after, decode_token, encode_token, track_changes
+from .encoding import ResponseEncoding
+from .importer import (IMPORT_MAX_ERRORS, ChunkReport, ImportFormat, ImportReport, RowError,
+                       chunked, detect_format, iter_records)
+from .statements import StatementCache, page_statements, paginate_prebuilt
+from .upsert import unique_keys, upsert_statement
 from .types import DEPENDENCIES, PYDANTIC_SCHEMA as SCHEMA
 
 try:
@@ -20,12 +40,23 @@ except ImportError:
 else:
     sqlmodel_installed = True
 
+logger = logging.getLogger("api_toolkit.crud")
+
+DELTA_LIMIT = 5000
+
+# order keys of a list request, (field, descending) ending with the primary key
+ORDER = Tuple[Tuple[str, bool], ...]
+
 CALLABLE = Callable[..., SQLModel]
 CALLABLE_LIST = Callable[..., Page[SQLModel]]
 
 SESSION_FUNC = Callable[..., Generator[Session, Any, None]]
 
 
+class UpsertResult(BaseModel):
+    count: int
+
+
 class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
     db_model: Type[SQLModel]
 
@@ -45,10 +76,39 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
             update_route: Union[bool, DEPENDENCIES] = True,
             delete_one_route: Union[bool, DEPENDENCIES] = True,
             delete_all_route: Union[bool, DEPENDENCIES] = True,
+            read_db_func: Optional[SESSION_FUNC] = None,
+            read_your_writes: float = 0,
+            instrumentation: Optional[QueryInstrumentation] = None,
+            get_many_route: Union[bool, DEPENDENCIES] = True,
+            upsert_route: Union[bool, DEPENDENCIES] = False,
+            upsert_schema: Optional[Type[SCHEMA]] = None,
+            upsert_conflict_keys: Optional[List[str]] = None,
+            upsert_update_fields: Optional[List[str]] = None,
+            upsert_batch_size: int = 500,
+            import_route: Union[bool, DEPENDENCIES] = False,
+            import_chunk_size: int = 1000,
+            coalesce_reads: bool = False,
+            broadcaster: Optional[Broadcaster] = None,
+            changes_route: Union[bool, DEPENDENCIES] = True,
+            reject_unindexed_order: bool = False,
+            delta_route: Union[bool, DEPENDENCIES] = False,
+            delta_column: str = "updated_time",
+            delta_lag: float = 5,
+            response_encoding: Optional[ResponseEncoding] = None,
+            aggregate_route: Union[bool, DEPENDENCIES] = False,
+            aggregate_cache_ttl: float = 0,
+            admission: Optional[AdmissionControl] = None,
             **kwargs: Any
     ):
         assert sqlmodel_installed, "package sqlmodel must be installed."
         self.db_func = db_func
+        self.read_db_func = read_db_func
+        self.read_your_writes = read_your_writes
+        self.instrumentation = instrumentation
+        self.admission = admission
+        self.single_flight = SingleFlight() if coalesce_reads else None
+        self.statement_cache = StatementCache()
+        self.broadcaster = broadcaster
         self.db_model = db_model
         self._pk: str = db_model.__table__.primary_key.columns.keys()[0]
         self._pk_type: type = utils.get_pk_type(db_model, self._pk)
@@ -56,6 +116,14 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
                                        not hasattr(field_type, 'Config')]
         self.filter_fields = filter_fields or []
         self.order_fields = order_fields or []
+        self.reject_unindexed_order = reject_unindexed_order
+        # set when the router serves `/delta`, set-based writers keep it current themselves
+        self.delta_column: Optional[str] = None
+        self._unindexed_orders_seen: Set[Tuple[str, ...]] = set()
+        self._check_order_fields()
+        self.response_encoding = response_encoding
+        if response_encoding:
+            kwargs.setdefault("route_class", response_encoding.route_class)
         super().__init__(
             schema=db_model,
             create_schema=create_schema,
@@ -64,6 +132,7 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
             tags=tags,
             get_all_route=get_all_route,
             get_one_route=get_one_route,
+            get_many_route=get_many_route,
             create_route=create_route,
             update_route=update_route,
             delete_one_route=delete_one_route,
@@ -71,25 +140,201 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
             **kwargs
         )
 
+        if upsert_route:
+            columns = self.db_model.__table__.columns
+            self.upsert_schema = upsert_schema or self.schema
+            self.upsert_conflict_keys = upsert_conflict_keys or [self._pk]
+            self.upsert_batch_size = upsert_batch_size
+            if tuple(sorted(self.upsert_conflict_keys)) not in unique_keys(self.db_model.__table__):
+                raise ValueError(f"upsert conflict keys {self.upsert_conflict_keys} of {self.db_model.__name__} "
+                                 f"must be the primary key or covered by a unique constraint.")
+            self.upsert_update_fields = (
+                upsert_update_fields
+                if upsert_update_fields is not None
+                else [name for name in columns.keys()
+                      if name not in self.upsert_conflict_keys and name != self._pk]
+            )
+            unknown = set(self.upsert_update_fields) - set(columns.keys())
+            if unknown:
+                raise ValueError(f"upsert update fields {sorted(unknown)} are not columns of {self.db_model.__name__}.")
+            self._add_api_route(
+                "",
+                self._upsert(),
+                methods=["PUT"],
+                response_model=UpsertResult,
+                summary="Upsert One or Many",
+                dependencies=upsert_route,
+            )
+
+        if import_route:
+            self.import_chunk_size = import_chunk_size
+            self._add_api_route(
+                "/_import",
+                self._import(),
+                methods=["POST"],
+                response_model=ImportReport,
+                summary="Import NDJSON or CSV",
+                dependencies=import_route,
+            )
+
+        if broadcaster and changes_route:
+            self._add_api_route(
+                "/changes",
+                self._changes(),
+                methods=["GET"],
+                summary="Change Feed (Server-Sent Events)",
+                dependencies=changes_route,
+                admission_class=RouteClass.stream,
+            )
+            self._move_ahead_of_item_routes()
+
+        if delta_route:
+            # ORM writes are tracked by listeners, the set-based writers of this package (upsert, import,
+            # bulk change_owner, cascade and reassign of group deletes, the state sweeper) stamp and bury
+            # themselves; a raw UPDATE or DELETE issued by the app is not seen by the feed
+            if delta_column not in self.db_model.__table__.columns:
+                raise ValueError(f"{self.db_model.__name__} has no {delta_column} column to serve /delta from.")
+            self.delta_column = delta_column
+            self.delta_lag = delta_lag
+            self.tombstones = track_changes(self.db_model, delta_column, self._pk)
+            self._add_api_route(
+                "/delta",
+                self._delta(),
+                methods=["GET"],
+                response_model=Delta[self.schema],  # type: ignore
+                summary="Changes Since Token",
+                dependencies=delta_route,
+                admission_class=RouteClass.export,
+            )
+            self._move_ahead_of_item_routes()
+
+        if aggregate_route:
+            if not self.filter_fields:
+                raise ValueError(f"aggregate route of {self.db_model.__name__} needs filter_fields to aggregate over.")
+            self.aggregate_cache = TTLCache(aggregate_cache_ttl) if aggregate_cache_ttl > 0 else None
+            self._add_api_route(
+                "/aggregate",
+                self._aggregate(),
+                methods=["GET"],
+                response_model=Aggregate,
+                summary="Count, Sum, Min and Max",
+                dependencies=aggregate_route,
+                coalesce=True,
+            )
+            self._move_ahead_of_item_routes()
+
+    def _move_ahead_of_item_routes(self) -> None:
+        """Move the route added last ahead of "/{item_id}", which would otherwise capture its path."""
+        item_route = next((i for i, route in enumerate(self.routes) if route.path.endswith("/{item_id}")), None)
+        # without item routes there is nothing to shadow it
+        if item_route is not None:
+            self.routes.insert(item_route, self.routes.pop())
+
+    def _add_api_route(
+            self,
+            path: str,
+            endpoint: Callable[..., Any],
+            dependencies: Union[bool, DEPENDENCIES],
+            error_responses: Optional[List[Any]] = None,
+            coalesce: bool = False,
+            admission_class: Optional[RouteClass] = None,
+            **kwargs: Any,
+    ) -> None:
+        dependencies = [] if isinstance(dependencies, bool) else list(dependencies)
+        # concurrent identical reads share one query and one encoded response
+        if coalesce and self.single_flight:
+            endpoint = coalesce_endpoint(self.single_flight, endpoint, kwargs.get("response_model"))
+        if self.instrumentation:
+            dependencies.insert(0, Depends(self.instrumentation.dependency))
+        # first of all, so a rejected request never takes a threadpool worker or a connection
+        if self.admission:
+            if admission_class is None:
+                reads = set(kwargs.get("methods") or ["GET"]) <= {"GET", "HEAD"}
+                admission_class = RouteClass.read if reads else RouteClass.write
+            admit = self.admission.dependency(admission_class)
+            if admit:
+                dependencies.insert(0, Depends(admit))
+        # after a write, pin the client's reads to the primary until the replica has caught up
+        if self.read_db_func and self.read_your_writes and set(kwargs.get("methods") or []) - {"GET"}:
+            dependencies.append(Depends(pin_primary_depend(self.read_your_writes)))
+        super()._add_api_route(path, endpoint, dependencies, error_responses, **kwargs)
+
+    def _read_db(self) -> SESSION_FUNC:
+        """Session dependency of read-only routes, served by `read_db_func` when one is configured."""
+        return read_session_depend(self.db_func, self.read_db_func)
+
+    def _indexed_orders(self) -> Set[Tuple[str, ...]]:
+        """Column sequences an index can return in order: every prefix of the primary key and each index."""
+        table = self.db_model.__table__
+        keys = [tuple(table.primary_key.columns.keys())]
+        keys += [tuple(column.name for column in index.columns) for index in table.indexes]
+        keys += [tuple(column.name for column in constraint.columns) for constraint in table.constraints
+                 if isinstance(constraint, UniqueConstraint)]
+        return {key[:n] for key in keys for n in range(1, len(key) + 1)}
+
+    def _check_order_fields(self) -> None:
+        columns = self.db_model.__table__.columns
+        unknown = [name for name in self.order_fields if name not in columns]
+        if unknown:
+            raise ValueError(f"order fields {unknown} are not columns of {self.db_model.__name__}.")
+        indexed = self._indexed_orders()
+        unindexed = [name for name in self.order_fields if (name,) not in indexed]
+        if not unindexed:
+            return
+        message = (f"order fields {unindexed} of {self.db_model.__name__} lead no index, "
+                   f"sorting on them needs a full sort of the matching rows.")
+        if self.reject_unindexed_order:
+            raise ValueError(message)
+        warnings.warn(message, stacklevel=3)
+
     def _order_by_depend(self):
-        fields_enum = Enum(f'{self.db_model.__name__}OrderFields',
-                           {field_name: field_name for field_name in self.pure_fields
-                            if field_name in self.order_fields})
+        columns = self.db_model.__table__.columns
+        pk = columns[self._pk]
+        allowed = [name for name in self.order_fields if name in columns]
+        indexed = self._indexed_orders()
+        fields_enum = Enum(f'{self.db_model.__name__}OrderFields', {name: name for name in allowed})
 
         order_dir_enum = Enum(f'{self.db_model.__name__}OrderDir', {'asc': 'asc', 'desc': 'desc'})
 
-        def route(order_by: Optional[fields_enum] = None,
-                  order_dir: Optional[order_dir_enum] = order_dir_enum('asc')):
-            if not order_by:
-                return None
-            if order_by not in fields_enum:
-                raise ValueError(f"order_by value is not a valid field name: {order_by.value}")
-            if order_dir.value not in ['asc', 'desc']:
-                raise ValueError(f"order_dir value must be 'asc' or 'desc': {order_dir.value}")
-            return order_by, order_dir
+        def route(order: Optional[str] = Query(
+                      None, description=f"comma separated fields of {allowed}, '-' sorts descending, "
+                                        f"e.g. -{allowed[0] if allowed else self._pk},{self._pk}"),
+                  order_by: Optional[fields_enum] = Query(None, deprecated=True),
+                  order_dir: order_dir_enum = Query(order_dir_enum('asc'), deprecated=True),
+                  ) -> ORDER:
+            keys: List[Tuple[str, bool]] = []
+            if order:
+                for token in order.split(","):
+                    name = token.strip().lstrip("+-")
+                    if not name:
+                        continue
+                    if (name != self._pk and name not in allowed) or name in dict(keys):
+                        raise utils.create_query_validation_exception(
+                            field="order", msg=f"{name} is not an order field or is repeated")
+                    keys.append((name, token.strip().startswith("-")))
+            elif order_by:
+                keys.append((order_by.value, order_dir.value == 'desc'))
+
+            names = tuple(name for name, _ in keys if name != self._pk)
+            if names and names not in indexed:
+                if self.reject_unindexed_order:
+                    raise utils.create_query_validation_exception(
+                        field="order", msg=f"no index serves the order {','.join(names)}")
+                if names not in self._unindexed_orders_seen:
+                    self._unindexed_orders_seen.add(names)
+                    logger.warning("%s sorted on %s, which no index serves", self.db_model.__name__, names)
+
+            # the primary key makes the order total, so pages neither repeat nor skip rows
+            if self._pk not in dict(keys):
+                keys.append((self._pk, keys[-1][1] if keys else False))
+            return tuple(keys)
 
         return route
 
+    def _order_clauses(self, order: ORDER) -> List[ColumnElement]:
+        columns = self.db_model.__table__.columns
+        return [columns[name].desc() if desc else columns[name].asc() for name, desc in order]
+
     def _filter_depend(self):
         fields_enum = Enum(f'{self.db_model.__name__}FilterFields',
                            {field_name: field_name for field_name in self.pure_fields
@@ -106,23 +351,116 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
         return route
 
     def _get_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
-        def route(db: Session = Depends(self.db_func),
+        def route(db: Session = Depends(self._read_db()),
                   order=Depends(self._order_by_depend()),
                   filter_=Depends(self._filter_depend())) -> Page[SQLModel]:
-            query = select(self.db_model)
-            if order:
-                order_key, order_dir = order
-                query = query.order_by(text(f'{order_key.value} {order_dir.value}'))
+            filter_key, values = (filter_[0].value, {"filter_value": filter_[1]}) if filter_ else (None, {})
+            statements = self.statement_cache.get(
+                ("list", filter_key, order), lambda: self._page_statements(select(self.db_model), filter_key, order))
+            return paginate_prebuilt(db, statements, values)
+
+        return route
+
+    def _page_statements(self, query: Any, filter_key: Optional[str], order: ORDER) -> Tuple[Any, Any]:
+        """Prebuilt list statements of one (filter, order) shape, the filter value is bound as `filter_value`."""
+        if filter_key:
+            query = query.where(text(f'{filter_key} = :filter_value'))
+        return page_statements(query.order_by(*self._order_clauses(order)))
+
+    def _aggregate_scope(self) -> Callable[..., Optional[ColumnElement]]:
+        """Dependency resolving the condition every aggregated row must meet, None for the whole table."""
+        def scope() -> Optional[ColumnElement]:
+            return None
+
+        return scope
+
+    def _aggregate(self, *args: Any, **kwargs: Any) -> Callable[..., Aggregate]:
+        columns = self.db_model.__table__.columns
+        fields = [name for name in self.filter_fields if name in columns]
+        fields_enum = Enum(f'{self.db_model.__name__}AggregateFields', {name: name for name in fields})
+        numeric = {name for name in fields if summable(columns[name])}
+
+        def route(group_by: List[fields_enum] = Query([]),  # type: ignore
+                  sum_: List[fields_enum] = Query([], alias="sum"),  # type: ignore
+                  min_: List[fields_enum] = Query([], alias="min"),  # type: ignore
+                  max_: List[fields_enum] = Query([], alias="max"),  # type: ignore
+                  filter_=Depends(self._filter_depend()),
+                  scope: Optional[ColumnElement] = Depends(self._aggregate_scope()),
+                  db: Session = Depends(self._read_db())) -> Aggregate:
+            requested = dict(zip(FUNCTIONS, ([f.value for f in fs] for fs in (sum_, min_, max_))))
+            not_numeric = [name for name in requested["sum"] if name not in numeric]
+            if not_numeric:
+                raise utils.create_query_validation_exception(field="sum", msg=f"{not_numeric} are not numeric")
+            groups = list(dict.fromkeys(f.value for f in group_by))
+
+            key = None
+            if self.aggregate_cache:
+                key = (tuple(groups), tuple((name, tuple(v)) for name, v in requested.items()),
+                       (filter_[0].value, filter_[1]) if filter_ else None, scope_key(scope))
+                cached = self.aggregate_cache.get(key)
+                if cached is not None:
+                    return cached
+
+            selected = [columns[name] for name in groups] + [func.count().label("count")]
+            for function, names in requested.items():
+                selected += [getattr(func, function)(columns[name]).label(f"{function}:{name}") for name in names]
+            query = select(*selected).select_from(self.db_model.__table__)
+            if scope is not None:
+                query = query.where(scope)
             if filter_:
                 filter_key, filter_value = filter_
                 query = query.where(text(f'{filter_key.value} = :filter_value')).params(filter_value=filter_value)
-            return paginate(db, query)
+            if groups:
+                group_columns = [columns[name] for name in groups]
+                query = query.group_by(*group_columns).order_by(*group_columns).limit(AGGREGATE_MAX_GROUPS + 1)
+
+            rows = db.execute(query).all()
+            result = Aggregate(rows=[
+                AggregateRow(group={name: row[i] for i, name in enumerate(groups)},
+                             count=row["count"],
+                             **{function: {name: row[f"{function}:{name}"] for name in names}
+                                for function, names in requested.items()})
+                for row in rows[:AGGREGATE_MAX_GROUPS]
+            ], truncated=len(rows) > AGGREGATE_MAX_GROUPS)
+            if key is not None:
+                self.aggregate_cache.set(key, result)
+            return result
+
+        return route
+
+    def _publish(self, action: str, item: Any = None, data: Any = None, **fields: Any) -> None:
+        """Publish a change of this router's table to the `/changes` subscribers, if a broadcaster is set."""
+        if not self.broadcaster:
+            return
+        if item is not None:
+            fields.setdefault("id", jsonable_encoder(getattr(item, self._pk)))
+            if getattr(item, "own_group_id", None) is not None:
+                fields.setdefault("group_id", str(item.own_group_id))
+            if getattr(item, "state", None) is not None:
+                fields.setdefault("state", jsonable_encoder(item.state))
+        self.broadcaster.publish(ChangeEvent(topic=self.db_model.__tablename__, action=action,
+                                             data=jsonable_encoder(data), **fields))
+
+    def _changes_match(self) -> Callable[..., MATCH]:
+        """Dependency resolving which events a `/changes` subscriber receives, None for all of them."""
+        def match() -> MATCH:
+            return None
+
+        return match
+
+    def _changes(self, *args: Any, **kwargs: Any) -> Callable[..., StreamingResponse]:
+        async def route(request: Request, match: MATCH = Depends(self._changes_match())) -> StreamingResponse:
+            return StreamingResponse(
+                self.broadcaster.stream(request, self.db_model.__tablename__, match),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
 
         return route
 
     def _get_one(self, *args: Any, **kwargs: Any) -> CALLABLE:
         def route(
-                item_id: self._pk_type, db: Session = Depends(self.db_func)  # type: ignore
+                item_id: self._pk_type, db: Session = Depends(self._read_db())  # type: ignore
         ) -> SQLModel:
             model: SQLModel = db.get(self.db_model, item_id)
 
@@ -133,6 +471,41 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
 
         return route
 
+    def _ids_depend(self, in_body: bool = False):
+        pk_type = self._pk_type
+
+        if in_body:
+            def route(ids: List[pk_type] = Body(..., embed=True)) -> List[Any]:  # type: ignore
+                return self._check_ids(ids)
+        else:
+            def route(ids: List[pk_type] = Query(...)) -> List[Any]:  # type: ignore
+                return self._check_ids(ids)
+
+        return route
+
+    @staticmethod
+    def _check_ids(ids: List[Any]) -> List[Any]:
+        if len(ids) > GET_MANY_LIMIT:
+            raise utils.create_query_validation_exception(
+                field="ids", msg=f"at most {GET_MANY_LIMIT} ids can be fetched at once")
+        return ids
+
+    def _items_by_ids(self, db: Session, query, ids: List[Any]) -> ItemsByIds:
+        """Fetch `ids` with a single `pk IN (...)` on `query` and line the rows up with the requested order."""
+        pk = getattr(self.db_model, self._pk)
+        unique_ids = list(dict.fromkeys(ids))
+        found = {getattr(item, self._pk): item for item in db.exec(query.where(pk.in_(unique_ids))).all()} \
+            if unique_ids else {}
+        return ItemsByIds(items=[found.get(item_id) for item_id in ids],
+                          missing=[item_id for item_id in unique_ids if item_id not in found])
+
+    def _get_many(self, in_body: bool = False, *args: Any, **kwargs: Any) -> Callable[..., ItemsByIds]:
+        def route(ids: List[Any] = Depends(self._ids_depend(in_body)),
+                  db: Session = Depends(self._read_db())) -> ItemsByIds:
+            return self._items_by_ids(db, select(self.db_model), ids)
+
+        return route
+
     def _create(self, *args: Any, **kwargs: Any) -> CALLABLE:
         def route(
                 model: self.create_schema,  # type: ignore
@@ -142,10 +515,169 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
             db.add(db_model)
             db.commit()
             db.refresh(db_model)
+            self._publish("create", db_model, db_model)
             return db_model
 
         return route
 
+    def _upsert_rows(self, models: List[SQLModel]) -> List[Dict[str, Any]]:
+        columns = self.db_model.__table__.columns.keys()
+        rows = [{key: value for key, value in model.dict().items() if key in columns} for model in models]
+        # let the database assign the primary key when no record carries one
+        if self._pk not in self.upsert_conflict_keys and all(row.get(self._pk) is None for row in rows):
+            for row in rows:
+                row.pop(self._pk, None)
+        return rows
+
+    def _execute_upsert(self, db: Session, rows: List[Dict[str, Any]], update: List[str]) -> None:
+        if self.delta_column:
+            # the statement bypasses the ORM listener that stamps rows for `/delta`
+            now = datetime.now()
+            for row in rows:
+                row[self.delta_column] = now
+            update = [*update, self.delta_column] if self.delta_column not in update else update
+        dialect = db.get_bind().dialect.name
+        try:
+            for start in range(0, len(rows), self.upsert_batch_size):
+                db.execute(upsert_statement(dialect, self.db_model.__table__,
+                                            rows[start:start + self.upsert_batch_size],
+                                            self.upsert_conflict_keys, update))
+        except NotImplementedError as e:
+            raise HTTPException(status.HTTP_501_NOT_IMPLEMENTED, str(e))
+        db.commit()
+
+    def _upsert(self, *args: Any, **kwargs: Any) -> Callable[..., UpsertResult]:
+        def route(
+                models: Union[List[self.upsert_schema], self.upsert_schema],  # type: ignore
+                db: Session = Depends(self.db_func),
+        ) -> UpsertResult:
+            rows = self._upsert_rows(models if isinstance(models, list) else [models])
+            if not rows:
+                return UpsertResult(count=0)
+            self._execute_upsert(db, rows, [name for name in self.upsert_update_fields if name in rows[0]])
+            self._publish("upsert", data={"count": len(rows)})
+            return UpsertResult(count=len(rows))
+
+        return route
+
+    def _table_row(self, model: SCHEMA) -> Dict[str, Any]:
+        db_model = self.db_model(**model.dict())
+        row = {name: getattr(db_model, name) for name in self.db_model.__table__.columns.keys()}
+        if row.get(self._pk) is None:
+            row.pop(self._pk, None)
+        return row
+
+    def _import_chunk(self, db: Session, number: int, records: List[Any], report: ImportReport,
+                      stamp: Optional[Dict[str, Any]] = None) -> ChunkReport:
+        """Validate and insert one chunk, `stamp` overrides columns of every row."""
+        chunk = ChunkReport(chunk=number, first_row=records[0][0], last_row=records[-1][0])
+        rows = []
+        for row, record in records:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                row = self._table_row(self.create_schema.parse_obj(record))
+                rows.append({**row, **stamp} if stamp else row)
+                continue
+            except ValidationError as e:
+                errors = e.errors()
+            except (ValueError, TypeError) as e:
+                errors = [{"msg": str(e)}]
+            chunk.rejected += 1
+            if report.rejected + chunk.rejected <= IMPORT_MAX_ERRORS:
+                chunk.errors.append(RowError(row=row, errors=errors))
+        if rows:
+            try:
+                db.execute(self.db_model.__table__.insert(), rows)
+                db.commit()
+                chunk.inserted = len(rows)
+            except SQLAlchemyError as e:
+                db.rollback()
+                chunk.rejected += len(rows)
+                chunk.error = str(getattr(e, "orig", None) or e)
+        return chunk
+
+    def _import_file(self, db: Session, file: UploadFile, format: Optional[ImportFormat],
+                     stamp: Optional[Dict[str, Any]] = None) -> ImportReport:
+        # the upload is spooled to a temporary file, it is parsed and inserted one chunk at a time
+        format_ = format or detect_format(file.filename, file.content_type)
+        report = ImportReport()
+        records = iter_records(file.file, format_)
+        for number, records_chunk in enumerate(chunked(records, self.import_chunk_size), start=1):
+            chunk = self._import_chunk(db, number, records_chunk, report, stamp)
+            report.inserted += chunk.inserted
+            report.rejected += chunk.rejected
+            report.chunks.append(chunk)
+        return report
+
+    def _import(self, *args: Any, **kwargs: Any) -> Callable[..., ImportReport]:
+        def route(
+                file: UploadFile = File(..., description="NDJSON, or CSV with a header row"),
+                format: Optional[ImportFormat] = Query(None, description="default: from the file name or type"),
+                db: Session = Depends(self.db_func),
+        ) -> ImportReport:
+            report = self._import_file(db, file, format)
+            if report.inserted:
+                self._publish("import", data={"count": report.inserted})
+            return report
+
+        return route
+
+    def _delta_page(self, db: Session, since: Optional[str], limit: int, query: Select,
+                    tombstone_scope: Optional[ColumnElement] = None) -> Delta:
+        """The page of `/delta` over the rows of `query` and the tombstones within `tombstone_scope`."""
+        try:
+            items_after, deleted_after = decode_token(since) if since else (None, None)
+        except (ValueError, TypeError):
+            raise utils.create_query_validation_exception(field="since", msg="invalid token")
+        horizon = datetime.now() - timedelta(seconds=self.delta_lag)
+
+        timestamp, pk = getattr(self.db_model, self.delta_column), getattr(self.db_model, self._pk)
+        query = query.where(timestamp <= horizon)
+        if items_after:
+            query = query.where(after(timestamp, pk, items_after))
+        items = db.exec(query.order_by(timestamp, pk).limit(limit + 1)).all()
+
+        tombstone = self.tombstones.c
+        query = select(self.tombstones).where(tombstone.table_name == self.db_model.__tablename__,
+                                              tombstone.deleted_time <= horizon)
+        if tombstone_scope is not None:
+            query = query.where(tombstone_scope)
+        if deleted_after:
+            query = query.where(after(tombstone.deleted_time, tombstone.id, deleted_after))
+        tombstones = db.execute(query.order_by(tombstone.deleted_time, tombstone.id).limit(limit + 1)).all()
+
+        def position(rows, time_of, id_of, previous):
+            if len(rows) > limit:
+                return time_of(rows[limit - 1]), jsonable_encoder(id_of(rows[limit - 1]))
+            # everything up to the horizon has been served, never move back behind the previous token
+            return max(previous, (horizon, None), key=lambda p: p[0]) if previous else (horizon, None)
+
+        token = encode_token(
+            position(items, lambda row: getattr(row, self.delta_column), lambda row: getattr(row, self._pk),
+                     items_after),
+            position(tombstones, lambda row: row.deleted_time, lambda row: row.id, deleted_after),
+        )
+        return Delta[self.schema](  # type: ignore
+            items=items[:limit],
+            deleted=[json.loads(row.item_id) for row in tombstones[:limit]],
+            token=token,
+            has_more=len(items) > limit or len(tombstones) > limit,
+        )
+
+    def _delta(self, *args: Any, **kwargs: Any) -> Callable[..., Delta]:
+        def route(since: Optional[str] = Query(None, description="token of the previous response, omit to start over"),
+                  limit: int = Query(500, ge=1, le=DELTA_LIMIT),
+                  db: Session = Depends(self.db_func)) -> Delta:
+            """
+            Rows written and ids deleted since `since`, in (timestamp, pk) keyset order.
+            Only changes older than `delta_lag` seconds are served: a row committed late or stamped by a
+            clock running behind is still picked up by the next call, rows sharing a timestamp are never split.
+            """
+            return self._delta_page(db, since, limit, select(self.db_model))
+
+        return route
+
     def _update(self, *args: Any, **kwargs: Any) -> CALLABLE:
         def route(
                 item_id: self._pk_type,  # type: ignore
@@ -160,17 +692,22 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
 
             db.commit()
             db.refresh(db_model)
+            self._publish("update", db_model, db_model)
 
             return db_model
 
         return route
 
     def _delete_all(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
-        def route(db: Session = Depends(self.db_func)) -> Page[SQLModel]:
-            for item in db.exec(select(self.db_model)).all():
+        def route(db: Session = Depends(self.db_func)) -> List[SQLModel]:
+            items = db.exec(select(self.db_model)).all()
+            for item in items:
                 db.delete(item)
             db.commit()
-            return self._get_all()(db=db)
+            for item in items:
+                self._publish("delete", item)
+            # the rows left over, as a list: the route is not paginated
+            return db.exec(select(self.db_model).order_by(getattr(self.db_model, self._pk))).all()
 
         return route
 
@@ -181,6 +718,7 @@ class SQLModelCRUDRouter(CRUDGenerator[SCHEMA]):
             db_model: SQLModel = self._get_one()(item_id, db)
             db.delete(db_model)
             db.commit()
+            self._publish("delete", db_model)
 
             return db_model
 
@@ -0,0 +1,101 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Generic, List, Optional, Tuple, Type, TypeVar
+
+from pydantic.generics import GenericModel
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, and_, event, inspect, or_
+from sqlalchemy.sql import ColumnElement
+from sqlmodel import SQLModel
+from sqlmodel.sql.sqltypes import GUID, AutoString
+
+T = TypeVar("T")
+
+# keyset position of one stream: rows after (timestamp, id), `id` None means every row at `timestamp`
+POSITION = Optional[Tuple[datetime, Any]]
+
+TOMBSTONE_TABLE = "api_toolkit_tombstone"
+
+# (timestamp, pk, tombstone table) of every table served by a `/delta` route
+TRACKED: Dict[Table, Tuple[str, str, Table]] = {}
+
+
+def tombstone_table(metadata: MetaData) -> Table:
+    """
+    One row per deleted item of the tables served by a `/delta` route, declared in `metadata` by the
+    first such route, so `create_all` only creates it for apps that have one.
+    """
+    table = metadata.tables.get(TOMBSTONE_TABLE)
+    if table is None:
+        table = Table(
+            TOMBSTONE_TABLE, metadata,
+            Column("id", Integer, primary_key=True),
+            Column("table_name", AutoString, nullable=False, index=True),
+            Column("item_id", AutoString, nullable=False),
+            # the group the item was in, group-scoped feeds only see the tombstones of their groups
+            Column("group_id", GUID, index=True),
+            Column("deleted_time", DateTime, nullable=False, index=True),
+        )
+    return table
+
+
+class Delta(GenericModel, Generic[T]):
+    items: List[T]
+    deleted: List[Any]
+    token: str
+    has_more: bool
+
+
+def encode_token(items: POSITION, deleted: POSITION) -> str:
+    raw = json.dumps([[position[0].isoformat(), position[1]] if position else None for position in (items, deleted)])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_token(token: str) -> Tuple[POSITION, POSITION]:
+    items, deleted = json.loads(base64.urlsafe_b64decode(token.encode()))
+    return tuple((datetime.fromisoformat(p[0]), p[1]) if p else None for p in (items, deleted))  # type: ignore
+
+
+def after(timestamp: Any, id_: Any, position: POSITION) -> Optional[ColumnElement]:
+    if position is None:
+        return None
+    if position[1] is None:
+        return timestamp > position[0]
+    return or_(timestamp > position[0], and_(timestamp == position[0], id_ > position[1]))
+
+
+def track_changes(model: Type[SQLModel], timestamp: str, pk: str) -> Table:
+    """
+    Keep `timestamp` current on every ORM update and record a tombstone for every ORM delete of `model`,
+    and for every change of its `own_group_id`, which removes it from the feed of its previous group.
+    Returns the tombstone table.
+    Set-based writes skip these listeners, the writers of this package look the table up in `TRACKED`
+    and stamp and bury themselves.
+    """
+    tombstones = tombstone_table(model.metadata)
+    if not event.contains(model, "before_update", _touch):
+        model.__delta__ = (timestamp, pk, tombstones)
+        TRACKED[model.__table__] = model.__delta__
+        event.listen(model, "before_update", _touch)
+        event.listen(model, "after_delete", _bury)
+    return tombstones
+
+
+def _touch(mapper, connection, target: Any) -> None:
+    setattr(target, type(target).__delta__[0], datetime.now())
+    if "own_group_id" in mapper.attrs:
+        previous = inspect(target).attrs.own_group_id.history.deleted
+        if previous and previous[0] is not None and previous[0] != target.own_group_id:
+            _bury(mapper, connection, target, previous[0])
+
+
+def tombstone(table_name: str, item_id: Any, group_id: Any = None) -> Dict[str, Any]:
+    """The values of the tombstone of item `item_id` of `table_name` leaving the feed of `group_id`."""
+    return dict(table_name=table_name, item_id=json.dumps(item_id, default=str),
+                group_id=group_id, deleted_time=datetime.now())
+
+
+def _bury(mapper, connection, target: Any, group_id: Any = None) -> None:
+    _, pk, tombstones = type(target).__delta__
+    connection.execute(tombstones.insert().values(**tombstone(
+        target.__tablename__, getattr(target, pk), group_id or getattr(target, "own_group_id", None))))
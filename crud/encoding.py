@@ -0,0 +1,187 @@
+import contextvars
+import gzip as gzip_module
+import importlib.util
+import json
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Sequence
+
+from fastapi import Request, Response
+from fastapi.datastructures import Default, DefaultPlaceholder
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+# media type chosen for the request being handled, read by NegotiatedResponse when it renders
+_media_type: contextvars.ContextVar[str] = contextvars.ContextVar("api_toolkit_media_type", default=JSON)
+
+_COMPRESSIBLE = ("application/json", "application/msgpack", "text/")
+
+
+def current_media_type() -> str:
+    return _media_type.get()
+
+
+def render(media_type: str, content: Any) -> bytes:
+    """Encode jsonable `content` as `media_type` in a single pass, with the separators of JSONResponse."""
+    if media_type == MSGPACK:
+        import msgpack
+
+        return msgpack.packb(content, use_bin_type=True)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class NegotiatedResponse(JSONResponse):
+    """JSONResponse rendering MessagePack instead when the client asked for it."""
+
+    def render(self, content: Any) -> bytes:
+        self.media_type = current_media_type()
+        return render(self.media_type, content)
+
+
+def _qualities(header: Optional[str]) -> Dict[str, float]:
+    qualities = {}
+    for item in (header or "").split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        if not name:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.lower()] = quality
+    return qualities
+
+
+def _installed(package: str, wanted: Optional[bool], feature: str) -> bool:
+    # None: offered when the package is installed, True: required
+    available = importlib.util.find_spec(package) is not None
+    if wanted and not available:
+        raise ImportError(f"package {package} must be installed for {feature}.")
+    return available if wanted is None else wanted
+
+
+class ResponseEncoding:
+    """
+    Content negotiation for the routes of a router: `Accept: application/msgpack` renders MessagePack
+    straight from the serialized response model (no JSON pass), and bodies of at least `minimum_size`
+    bytes are compressed with brotli or gzip per `Accept-Encoding`. Streaming responses are compressed
+    chunk by chunk and flushed after each, so Server-Sent Events still arrive as they are sent.
+
+    `msgpack` and `brotli` need the packages of the same name, None enables them when installed.
+    Pass the instance as `response_encoding=` to the toolkit routers or to `AuthFactory(...)(...)`.
+    """
+
+    def __init__(self,
+                 msgpack: Optional[bool] = None,
+                 brotli: Optional[bool] = None,
+                 gzip: bool = True,
+                 minimum_size: int = 1024,
+                 gzip_level: int = 6,
+                 brotli_quality: int = 4,
+                 compressible_types: Sequence[str] = _COMPRESSIBLE):
+        self.msgpack = _installed("msgpack", msgpack, MSGPACK)
+        self.brotli = _installed("brotli", brotli, "brotli compression")
+        self.gzip = gzip
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.compressible_types = tuple(compressible_types)
+        self.route_class = type("EncodedRoute", (EncodedRoute,), {"encoding": self})
+
+    def media_type(self, accept: Optional[str]) -> str:
+        if not self.msgpack or not accept:
+            return JSON
+        qualities = _qualities(accept)
+        msgpack = max(qualities.get(MSGPACK, 0), qualities.get("application/x-msgpack", 0))
+        json_ = max(qualities.get(JSON, 0), qualities.get("application/*", 0), qualities.get("*/*", 0))
+        return MSGPACK if msgpack > 0 and msgpack >= json_ else JSON
+
+    def content_encoding(self, accept_encoding: Optional[str]) -> Optional[str]:
+        qualities = _qualities(accept_encoding)
+        offered = [name for name, on in (("br", self.brotli), ("gzip", self.gzip)) if on]
+        ranked = sorted(offered, key=lambda name: qualities.get(name, qualities.get("*", 0)), reverse=True)
+        for name in ranked:
+            if qualities.get(name, qualities.get("*", 0)) > 0:
+                return name
+        return None
+
+    def _compressor(self, encoding: str) -> Any:
+        if encoding == "br":
+            import brotli
+
+            return brotli.Compressor(quality=self.brotli_quality)
+        return zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def _compress(self, encoding: str, body: bytes) -> bytes:
+        if encoding == "br":
+            import brotli
+
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip_module.compress(body, self.gzip_level)
+
+    async def _compress_stream(self, encoding: str, chunks: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+        compressor = self._compressor(encoding)
+        br = encoding == "br"
+        async for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.process(chunk) + compressor.flush() if br \
+                else compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.finish() if br else compressor.flush()
+
+    def encode(self, request: Request, response: Response) -> Response:
+        """Compress `response` in place when its type, size and the request allow it."""
+        response.headers.append("Vary", "Accept-Encoding")
+        if self.msgpack:
+            response.headers.append("Vary", "Accept")
+        content_type = response.headers.get("content-type", "")
+        if "content-encoding" in response.headers or not content_type.startswith(self.compressible_types):
+            return response
+        encoding = self.content_encoding(request.headers.get("accept-encoding"))
+        if encoding is None:
+            return response
+
+        if isinstance(response, StreamingResponse):
+            response.body_iterator = self._compress_stream(encoding, response.body_iterator)
+            if "content-length" in response.headers:
+                del response.headers["content-length"]
+        else:
+            if len(response.body) < self.minimum_size:
+                return response
+            response.body = self._compress(encoding, response.body)
+            response.headers["content-length"] = str(len(response.body))
+        response.headers["content-encoding"] = encoding
+        return response
+
+
+class EncodedRoute(APIRoute):
+    """Route class of `ResponseEncoding.route_class`, which binds `encoding`."""
+    encoding: ResponseEncoding
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], *, response_class: Any = Default(JSONResponse),
+                 **kwargs: Any):
+        if isinstance(response_class, DefaultPlaceholder) and response_class.value is JSONResponse:
+            response_class = Default(NegotiatedResponse)
+        super().__init__(path, endpoint, response_class=response_class, **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+        encoding = self.encoding
+
+        async def route_handler(request: Request) -> Response:
+            token = _media_type.set(encoding.media_type(request.headers.get("accept")))
+            try:
+                response = await handler(request)
+            finally:
+                _media_type.reset(token)
+            return encoding.encode(request, response)
+
+        return route_handler
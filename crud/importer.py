@@ -0,0 +1,71 @@
+import codecs
+import csv
+import json
+from enum import Enum
+from itertools import islice
+from typing import Any, BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+# rejected rows reported in full per import, further rejections are only counted
+IMPORT_MAX_ERRORS = 1000
+
+
+class ImportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+class RowError(BaseModel):
+    row: int
+    errors: List[Any]
+
+
+class ChunkReport(BaseModel):
+    chunk: int
+    first_row: int
+    last_row: int
+    inserted: int = 0
+    rejected: int = 0
+    errors: List[RowError] = []
+    error: Optional[str] = None
+
+
+class ImportReport(BaseModel):
+    inserted: int = 0
+    rejected: int = 0
+    chunks: List[ChunkReport] = []
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> ImportFormat:
+    if (filename or "").lower().endswith(".csv") or "csv" in (content_type or ""):
+        return ImportFormat.csv
+    return ImportFormat.ndjson
+
+
+def iter_records(stream: BinaryIO, format_: ImportFormat) -> Iterator[Tuple[int, Any]]:
+    """
+    Yield `(row number, record)` one line at a time, the record is an exception for unparsable lines.
+    Empty CSV cells are left out of the record so that the schema defaults apply.
+    """
+    lines = codecs.getreader("utf-8-sig")(stream)
+    if format_ == ImportFormat.csv:
+        for row, record in enumerate(csv.DictReader(lines), start=1):
+            yield row, {key: value for key, value in record.items() if key is not None and value != ""}
+        return
+    for row, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield row, json.loads(line)
+        except ValueError as e:
+            yield row, e
+
+
+def chunked(records: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
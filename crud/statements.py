@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from fastapi_pagination import Page
+from fastapi_pagination.api import create_page, resolve_params
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+# bind parameters of the page window in statements built by `page_statements`
+PAGE_LIMIT = "page_limit"
+PAGE_OFFSET = "page_offset"
+
+
+class StatementCache:
+    """
+    Statements of the generated routes, built once per shape (filter field, order, scope kind...)
+    with bind parameters where the request values go. A steady-state request reuses the statement
+    object, whose cache key SQLAlchemy memoizes, so it neither rebuilds the expression tree
+    nor misses the compiled cache of the engine.
+    """
+
+    def __init__(self, max_shapes: int = 512):
+        self.max_shapes = max_shapes
+        self._statements: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, shape: Hashable, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            statement = self._statements.get(shape)
+            if statement is not None:
+                self.hits += 1
+                self._statements.move_to_end(shape)
+                return statement
+            self.misses += 1
+        statement = build()
+        with self._lock:
+            self._statements[shape] = statement
+            while len(self._statements) > self.max_shapes:
+                self._statements.popitem(last=False)
+        return statement
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"shapes": len(self._statements), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+def page_statements(query: Select) -> Tuple[Select, Select]:
+    """`(page of query, count of query)`, the same pair fastapi-pagination derives on every call."""
+    count = select(func.count()).select_from(query.order_by(None).subquery())
+    return query.limit(bindparam(PAGE_LIMIT)).offset(bindparam(PAGE_OFFSET)), count
+
+
+def paginate_prebuilt(db: Session, statements: Tuple[Select, Select], values: Dict[str, Any]) -> Page:
+    """Execute a pair of `page_statements` with `values` and the page parameters of the request."""
+    query, count = statements
+    params = resolve_params()
+    window = params.to_raw_params().as_limit_offset()
+    total = db.execute(count, values).scalar()
+    items = db.execute(query, {**values, PAGE_LIMIT: window.limit, PAGE_OFFSET: window.offset}).scalars().all()
+    return create_page(items, total=total, params=params)
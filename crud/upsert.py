@@ -0,0 +1,41 @@
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+from sqlalchemy import Table, UniqueConstraint
+from sqlalchemy.sql import Insert
+
+UPSERT_DIALECTS = ("mysql", "sqlite", "postgresql")
+
+
+def unique_keys(table: Table) -> Set[Tuple[str, ...]]:
+    """Column sets the database enforces uniqueness on: the primary key, unique constraints and indexes."""
+    keys = {tuple(sorted(table.primary_key.columns.keys()))}
+    keys |= {tuple(sorted(c.name for c in constraint.columns))
+             for constraint in table.constraints if isinstance(constraint, UniqueConstraint)}
+    keys |= {tuple(sorted(c.name for c in index.columns)) for index in table.indexes if index.unique}
+    keys |= {(column.name,) for column in table.columns if column.unique}
+    return keys
+
+
+def upsert_statement(dialect: str, table: Table, rows: List[Dict[str, Any]],
+                     conflict_keys: Sequence[str], update_columns: Sequence[str]) -> Insert:
+    """
+    One multi-row `INSERT` that updates `update_columns` of rows colliding on `conflict_keys`:
+    `ON CONFLICT (...) DO UPDATE` on SQLite and PostgreSQL, `ON DUPLICATE KEY UPDATE` on MySQL,
+    where the collision is detected on any unique key of the table.
+    """
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        statement = mysql_insert(table).values(rows)
+        return statement.on_duplicate_key_update({name: statement.inserted[name] for name in update_columns})
+
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert  # type: ignore
+    else:
+        raise NotImplementedError(f"native upsert is not supported on {dialect}, only on {', '.join(UPSERT_DIALECTS)}")
+    statement = insert(table).values(rows)
+    if not update_columns:
+        return statement.on_conflict_do_nothing(index_elements=list(conflict_keys))
+    return statement.on_conflict_do_update(index_elements=list(conflict_keys),
+                                           set_={name: statement.excluded[name] for name in update_columns})
@@ -0,0 +1,36 @@
+import importlib
+from typing import TYPE_CHECKING
+
+_exports = {
+    'AsyncSessionProvider': 'session',
+    'PoolStats': 'session',
+    'SessionProvider': 'session',
+    'QueryInstrumentation': 'instrument',
+    'fingerprint': 'instrument',
+    'read_session_depend': 'replica',
+    'pin_primary_depend': 'replica',
+    'pinned_to_primary': 'replica',
+    'PlanCheck': 'advisor',
+    'advise': 'advisor',
+}
+
+__all__ = list(_exports)
+
+if TYPE_CHECKING:
+    from .advisor import PlanCheck, advise
+    from .instrument import QueryInstrumentation, fingerprint
+    from .replica import read_session_depend, pin_primary_depend, pinned_to_primary
+    from .session import AsyncSessionProvider, PoolStats, SessionProvider
+
+
+def __getattr__(name: str):
+    # the routers only need `replica` and `instrument`, the async engine stack loads with the providers
+    if name in _exports:
+        value = getattr(importlib.import_module(f"{__name__}.{_exports[name]}"), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
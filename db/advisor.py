@@ -0,0 +1,220 @@
+"""
+Query-plan diagnostics for router configurations: every list query a router can generate
+(filter_fields x order_fields, the group scope of AuthCRUDRouter, the state filter of state routers)
+is EXPLAINed against a sample database, full scans and filesorts are flagged and an index is suggested.
+
+    python -m api_toolkit.db.advisor myapp.routers:routers --url sqlite:///sample.db
+
+where `myapp.routers.routers` is an iterable of routers, or a callable returning one.
+"""
+import argparse
+import datetime
+import decimal
+import enum
+import importlib
+import sys
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import Select
+from sqlmodel.sql.sqltypes import GUID
+
+SHAPE = Tuple[str, Select, List[str], List[str]]
+
+# stands in for a column value when the sample database has none, only the plan matters
+SAMPLES: Dict[type, Callable[[], Any]] = {
+    uuid.UUID: uuid.uuid4,
+    datetime.datetime: datetime.datetime.now,
+    datetime.date: datetime.date.today,
+    datetime.time: datetime.time,
+    datetime.timedelta: datetime.timedelta,
+    decimal.Decimal: decimal.Decimal,
+    bool: bool,
+    int: int,
+    float: float,
+    str: str,
+    bytes: bytes,
+}
+
+NO_SAMPLE = object()
+
+
+class PlanCheck(BaseModel):
+    router: str
+    query: str
+    sql: str
+    plan: List[str]
+    full_scan: bool = False
+    filesort: bool = False
+    suggestion: Optional[str] = None
+
+    @property
+    def flagged(self) -> bool:
+        return self.full_scan or self.filesort
+
+
+def _sample(conn: Connection, column: Any) -> Any:
+    """A value of `column`, from the sample database or `SAMPLES`, `NO_SAMPLE` when there is none."""
+    value = conn.execute(select(column).where(column.isnot(None)).limit(1)).scalar()
+    if value is not None:
+        return value
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        # sqlmodel's GUID, the type of every id and own_group_id, does not name its python type
+        if not isinstance(column.type, GUID):
+            return NO_SAMPLE
+        python_type = uuid.UUID
+    if isinstance(python_type, type) and issubclass(python_type, enum.Enum):
+        return next(iter(python_type), NO_SAMPLE)
+    factory = SAMPLES.get(python_type)
+    return factory() if factory else NO_SAMPLE
+
+
+def query_shapes(router: Any, conn: Connection) -> Iterator[SHAPE]:
+    """`(description, statement, equality columns, order columns)` of the list queries of `router`."""
+    model = router.db_model
+    table = model.__table__
+    pk = table.columns[router._pk]
+
+    base, scope, scope_columns = select(model), "", []
+    if hasattr(router, "auth") and "own_group_id" in table.columns:
+        base = router._scoped_query(router.auth.group_ids(_sample(conn, table.c.own_group_id)))
+        scope, scope_columns = " (group scope)", ["own_group_id"]
+
+    samples = {name: _sample(conn, table.columns[name]) for name in router.filter_fields}
+    for filter_field in [None, *router.filter_fields]:
+        # a column without a sample value is skipped rather than explained on a guessed value
+        if filter_field and samples[filter_field] is NO_SAMPLE:
+            continue
+        for order_field in [None, *router.order_fields]:
+            query, equality, order = base, list(scope_columns), []
+            description = f"GET {router.prefix}{scope}"
+            if filter_field:
+                query = query.where(table.columns[filter_field] == samples[filter_field])
+                equality.append(filter_field)
+                description += f" filter_by={filter_field}"
+            if order_field:
+                query = query.order_by(table.columns[order_field], pk)
+                order.append(order_field)
+                description += f" order={order_field}"
+            else:
+                query = query.order_by(pk)
+            yield description, query, equality, order
+
+    state = _sample(conn, table.c.state) if hasattr(router, "registrar") and "state" in table.columns else NO_SAMPLE
+    if state is not NO_SAMPLE:
+        yield f"GET {router.prefix}/ state", select(model).where(table.c.state == state), ["state"], []
+
+
+def explain(conn: Connection, statement: Select) -> List[str]:
+    """EXPLAIN `statement` with its binds processed as for a real execution."""
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+
+    def rewrite(conn_, cursor, sql, parameters, context, executemany):
+        return prefix + sql, parameters
+
+    event.listen(conn, "before_cursor_execute", rewrite, retval=True)
+    try:
+        cursor = conn.execute(statement).cursor
+        names = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+    finally:
+        event.remove(conn, "before_cursor_execute", rewrite)
+    if conn.dialect.name == "sqlite":
+        return [row[-1] for row in rows]
+    if conn.dialect.name == "mysql":
+        return [" ".join(f"{name}={value}" for name, value in zip(names, row)) for row in rows]
+    return [row[0] for row in rows]
+
+
+def analyze_plan(dialect: str, table: str, plan: List[str]) -> Tuple[bool, bool]:
+    """`(full scan of table, sort outside of an index)` as read from the EXPLAIN output of `dialect`."""
+    if dialect == "sqlite":
+        full_scan = any(line.split(" USING ")[0] in (f"SCAN {table}", f"SCAN TABLE {table}")
+                        and " INDEX " not in line for line in plan)
+        filesort = any("TEMP B-TREE FOR" in line and "ORDER BY" in line for line in plan)
+    elif dialect == "mysql":
+        full_scan = any(f"table={table} " in line and "type=ALL" in line for line in plan)
+        filesort = any("Using filesort" in line for line in plan)
+    else:
+        full_scan = any(f"Seq Scan on {table}" in line for line in plan)
+        filesort = any(line.strip().lstrip("-> ").startswith(("Sort ", "Incremental Sort ")) for line in plan)
+    return full_scan, filesort
+
+
+def suggest_index(conn: Connection, router: Any, equality: List[str], order: List[str]) -> Optional[str]:
+    """
+    Equality columns first, then the sort columns, so one index serves both the lookup and the order.
+    None when such an index exists, e.g. the group scope is an IN list whose rows no index returns in order.
+    """
+    table = router.db_model.__table__
+    columns = list(dict.fromkeys([*equality, *order]))
+    if not columns or tuple(columns) in router._indexed_orders():
+        return None
+    quote = conn.dialect.identifier_preparer.quote
+    name = f"ix_{table.name}_{'_'.join(columns)}"
+    return f"CREATE INDEX {quote(name)} ON {quote(table.name)} ({', '.join(quote(c) for c in columns)});"
+
+
+def advise(routers: Iterable[Any], bind: Engine) -> List[PlanCheck]:
+    checks = []
+    with bind.connect() as conn:
+        for router in routers:
+            table = router.db_model.__table__
+            for description, statement, equality, order in query_shapes(router, conn):
+                plan = explain(conn, statement)
+                full_scan, filesort = analyze_plan(conn.dialect.name, table.name, plan)
+                # a listing without a filter reads the whole table by design, only its sort matters
+                full_scan = full_scan and bool(equality)
+                check = PlanCheck(router=router.prefix, query=description,
+                                  sql=str(statement.compile(dialect=conn.dialect)),
+                                  plan=plan, full_scan=full_scan, filesort=filesort)
+                if check.flagged:
+                    check.suggestion = suggest_index(conn, router, equality, order)
+                checks.append(check)
+    return checks
+
+
+def format_report(checks: List[PlanCheck], show_all: bool = False) -> str:
+    lines = []
+    for check in checks:
+        if not check.flagged and not show_all:
+            continue
+        flags = ", ".join(flag for flag, on in (("full scan", check.full_scan), ("filesort", check.filesort)) if on)
+        lines.append(f"{check.query}: {flags or 'ok'}")
+        lines.extend(f"    {line}" for line in check.plan)
+    suggestions = list(dict.fromkeys(check.suggestion for check in checks if check.suggestion))
+    if suggestions:
+        lines.append("")
+        lines.append("-- suggested indexes")
+        lines.extend(suggestions)
+    flagged = sum(check.flagged for check in checks)
+    lines.append(f"\n{len(checks)} queries checked, {flagged} flagged")
+    return "\n".join(lines)
+
+
+def _load(target: str) -> List[Any]:
+    module_name, _, attribute = target.partition(":")
+    routers = getattr(importlib.import_module(module_name), attribute or "routers")
+    return list(routers() if callable(routers) else routers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("target", help="module:attribute holding the routers")
+    parser.add_argument("--url", required=True, help="sample database to EXPLAIN against")
+    parser.add_argument("--all", action="store_true", help="also print the plans that are not flagged")
+    parser.add_argument("--strict", action="store_true", help="exit non-zero when a query is flagged")
+    args = parser.parse_args()
+    checks = advise(_load(args.target), create_engine(args.url))
+    print(format_report(checks, args.all))
+    if args.strict and any(check.flagged for check in checks):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import contextlib
+import contextvars
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+
+logger = logging.getLogger("api_toolkit.db.slow_query")
+
+_current_route: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("api_toolkit_route", default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def fingerprint(statement: str) -> str:
+    """Normalize a statement so that executions differing only in literals or IN-list length match."""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _STRING.sub("?", statement)
+    statement = _PLACEHOLDER.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    return _PLACEHOLDER_LIST.sub("(?+)", statement)
+
+
+def _fingerprint_id(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+def _compile_outcome(context: Any) -> str:
+    # SQLAlchemy's verdict on the statement: compiled form reused, compiled now, or not cacheable at all
+    cache_hit = getattr(context, "cache_hit", None)
+    if cache_hit is CACHE_HIT:
+        return "hit"
+    if cache_hit is CACHE_MISS:
+        return "miss"
+    return "uncached"
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_prometheus(families: Dict[str, List[str]]) -> str:
+    """
+    The text exposition of `families`, keyed by `"<name> <type> <help>"`, each holding
+    the `{labels} value` samples of the metric.
+    """
+    lines = []
+    for family, samples in families.items():
+        name, type_, help_ = family.split(" ", 2)
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {type_}")
+        lines.extend(f"{name}{sample}" for sample in samples)
+    return "\n".join(lines) + "\n"
+
+
+class RouteQueries:
+    def __init__(self):
+        self.requests = 0
+        self.statements = 0
+        self.seconds = 0.0
+        # "hit" / "miss" / "uncached" -> statements, per the compiled cache of the engine
+        self.compiled: Dict[str, int] = defaultdict(int)
+        # fingerprint id -> [statements, seconds]
+        self.fingerprints: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+
+
+class QueryInstrumentation:
+    """
+    Attributes the statements sent through the given engines to the route that issued them:
+    statement count, DB time, compiled cache hits and normalized fingerprints per route, a slow-query log,
+    Prometheus text exposition and a query budget assertion for tests.
+
+    Add `instrumentation.dependency` to a router (the toolkit routers take `instrumentation=`),
+    or to the whole app with `FastAPI(dependencies=[Depends(instrumentation.dependency)])`.
+    """
+
+    def __init__(self, *engines: Any, slow_query_ms: float = 100, slow_query_log_size: int = 100):
+        self.slow_query_ms = slow_query_ms
+        self.routes: Dict[str, RouteQueries] = defaultdict(RouteQueries)
+        self.statements: Dict[str, str] = {}
+        self.slow_queries: Deque[Dict[str, Any]] = deque(maxlen=slow_query_log_size)
+        self._providers: List[Any] = []
+        self._lock = threading.Lock()
+        self._budgets: List[List[str]] = []
+        for engine in engines:
+            self.attach(engine)
+
+    def attach(self, engine: Any) -> None:
+        """Listen on an `Engine`, an `AsyncEngine` or a session provider of `api_toolkit.db`."""
+        if hasattr(engine, "pool_stats"):
+            self._providers.append(engine)
+            engine = engine.engine
+        engine = getattr(engine, "sync_engine", engine)
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    async def dependency(self, request: Request) -> None:
+        route = request.scope.get("route")
+        name = f"{request.method} {getattr(route, 'path', request.url.path)}"
+        _current_route.set(name)
+        with self._lock:
+            self.routes[name].requests += 1
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("api_toolkit_query_start", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - conn.info["api_toolkit_query_start"].pop()
+        normalized = fingerprint(statement)
+        key = _fingerprint_id(normalized)
+        outcome = _compile_outcome(context)
+        route = _current_route.get()
+        with self._lock:
+            self.statements.setdefault(key, normalized)
+            for budget in self._budgets:
+                budget.append(normalized)
+            if route is not None:
+                stats = self.routes[route]
+                stats.statements += 1
+                stats.seconds += elapsed
+                stats.compiled[outcome] += 1
+                stats.fingerprints[key][0] += 1
+                stats.fingerprints[key][1] += elapsed
+        if elapsed * 1000 >= self.slow_query_ms:
+            entry = {"route": route, "ms": round(elapsed * 1000, 3), "fingerprint": key, "statement": normalized}
+            self.slow_queries.append(entry)
+            logger.warning("slow query %.1fms on %s [%s]: %s", elapsed * 1000, route, key, normalized)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {
+                    "requests": stats.requests,
+                    "statements": stats.statements,
+                    "statements_per_request": round(stats.statements / stats.requests, 2) if stats.requests else 0,
+                    "db_ms": round(stats.seconds * 1000, 3),
+                    "compile_cache_hit_rate": round(stats.compiled["hit"] / stats.statements, 4)
+                    if stats.statements else 0,
+                    "compiled": dict(stats.compiled),
+                    "fingerprints": {self.statements[key]: count for key, (count, _) in stats.fingerprints.items()},
+                }
+                for name, stats in self.routes.items()
+            }
+
+    def prometheus(self) -> str:
+        families: Dict[str, List[str]] = {
+            "api_toolkit_route_requests_total counter Requests seen per route.": [],
+            "api_toolkit_route_db_statements_total counter SQL statements executed per route.": [],
+            "api_toolkit_route_db_seconds_total counter Time spent executing SQL per route.": [],
+            "api_toolkit_route_db_compiled_total counter Statements per route and compiled cache outcome.": [],
+            "api_toolkit_db_fingerprint_statements_total counter Executions per route and statement fingerprint.": [],
+            "api_toolkit_db_fingerprint_seconds_total counter Time per route and statement fingerprint.": [],
+        }
+        requests, statements, seconds_, compiled, fp_statements, fp_seconds = families.values()
+        with self._lock:
+            for name, stats in sorted(self.routes.items()):
+                route = f'route="{_label(name)}"'
+                requests.append(f"{{{route}}} {stats.requests}")
+                statements.append(f"{{{route}}} {stats.statements}")
+                seconds_.append(f"{{{route}}} {stats.seconds:.6f}")
+                for outcome, count in sorted(stats.compiled.items()):
+                    compiled.append(f'{{{route},outcome="{outcome}"}} {count}')
+                for key, (count, seconds) in sorted(stats.fingerprints.items()):
+                    labels = f'{route},fingerprint="{key}",statement="{_label(self.statements[key][:200])}"'
+                    fp_statements.append(f"{{{labels}}} {count}")
+                    fp_seconds.append(f"{{{labels}}} {seconds:.6f}")
+        for provider in self._providers:
+            pool = f'pool="{_label(provider.engine.url.render_as_string(hide_password=True))}"'
+            for metric, value in provider.pool_stats().items():
+                families.setdefault(f"api_toolkit_pool_{metric} gauge Connection pool {metric}.", []).append(
+                    f"{{{pool}}} {value}")
+
+        return render_prometheus(families)
+
+    def metrics_route(self):
+        """Endpoint serving `prometheus()`, e.g. `app.add_api_route("/metrics", instrumentation.metrics_route())`."""
+
+        async def metrics() -> PlainTextResponse:
+            return PlainTextResponse(self.prometheus(), media_type="text/plain; version=0.0.4")
+
+        return metrics
+
+    @contextlib.contextmanager
+    def assert_max_queries(self, budget: int) -> Iterator[List[str]]:
+        """
+        Test helper, fails when the block sends more than `budget` statements through the attached engines:
+
+            with instrumentation.assert_max_queries(1):
+                client.get("/item/1")
+        """
+        executed: List[str] = []
+        with self._lock:
+            self._budgets.append(executed)
+        try:
+            yield executed
+        finally:
+            with self._lock:
+                self._budgets.remove(executed)
+        if len(executed) > budget:
+            raise AssertionError(f"{len(executed)} queries executed, budget is {budget}:\n" +
+                                 "\n".join(f"  {statement}" for statement in executed))
+
+    def reset(self) -> None:
+        with self._lock:
+            self.routes.clear()
+            self.slow_queries.clear()
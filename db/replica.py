@@ -0,0 +1,46 @@
+import time
+from typing import Any, Callable, Optional
+
+from fastapi import Depends, Request, Response
+
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+PRIMARY_PIN_COOKIE = "db_primary_until"
+
+
+def pinned_to_primary(request: Request) -> bool:
+    """
+    Whether reads of this request must see its client's own writes: either it asks for it
+    with `X-Read-Your-Writes: 1`, or a recent write left a pin cookie that has not expired yet.
+    """
+    if request.headers.get(READ_YOUR_WRITES_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_session_depend(db_func: Callable[..., Any], read_db_func: Optional[Callable[..., Any]]):
+    """
+    Session dependency of read routes, the replica session unless the request is pinned to the primary.
+    Both sessions are lazy, the unused one never checks out a connection.
+    """
+    if read_db_func is None or read_db_func is db_func:
+        return db_func
+
+    async def route(request: Request,
+                    primary: Any = Depends(db_func),
+                    replica: Any = Depends(read_db_func)) -> Any:
+        return primary if pinned_to_primary(request) else replica
+
+    return route
+
+
+def pin_primary_depend(seconds: float):
+    """Dependency of write routes, pins the client's reads to the primary for `seconds` after the write."""
+
+    async def route(response: Response) -> None:
+        response.set_cookie(PRIMARY_PIN_COOKIE, f"{time.time() + seconds:.3f}",
+                            max_age=max(int(seconds), 1), httponly=True)
+
+    return route
@@ -0,0 +1,164 @@
+import threading
+import time
+import warnings
+from collections import deque
+from typing import Any, AsyncGenerator, Dict, Generator, Type
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+from sqlmodel import Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+class PoolStats:
+    """Checkout wait times and saturation of one connection pool."""
+
+    def __init__(self, size: int, max_overflow: int, window: int = 1024):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.checkouts = 0
+        self.timeouts = 0
+        self.peak_checked_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._waits = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def record_checkout(self, seconds: float, checked_out: int) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._waits.append(seconds)
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+
+    def snapshot(self, checked_out: int) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            capacity = self.size + max(self.max_overflow, 0)
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "checked_out": checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "saturation": round(checked_out / capacity, 4) if capacity else 0.0,
+                "peak_saturation": round(self.peak_checked_out / capacity, 4) if capacity else 0.0,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_ms_p99": round(waits[int(0.99 * (len(waits) - 1))] * 1000, 3) if waits else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+            }
+
+
+class _TimedPoolMixin:
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()  # type: ignore
+        except PoolTimeoutError:
+            self.stats.record_timeout()
+            raise
+        self.stats.record_checkout(time.perf_counter() - start, self.checkedout())  # type: ignore
+        return connection
+
+
+def _timed_pool(base: Type[Pool], stats: PoolStats) -> Type[Pool]:
+    # a per-provider subclass, so `engine.dispose()` recreating the pool keeps reporting to `stats`
+    return type(f"Timed{base.__name__}", (_TimedPoolMixin, base), {"stats": stats})
+
+
+def _engine_kwargs(url: str, pool_base: Type[Pool], stats: PoolStats, pool_size: int, max_overflow: int,
+                   pool_timeout: float, pool_recycle: int, pool_pre_ping: bool, kwargs: Dict[str, Any]):
+    poolclass = kwargs.get("poolclass", pool_base)
+    if issubclass(poolclass, QueuePool):
+        kwargs["poolclass"] = _timed_pool(poolclass, stats)
+        kwargs.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+    else:
+        warnings.warn(f"{poolclass.__name__} is not a QueuePool, pool_size, max_overflow and pool_timeout "
+                      f"are not applied and pool_stats() records no checkouts.", stacklevel=3)
+    if url.startswith("sqlite"):
+        # sync routes run in a threadpool, connections move between threads
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+    kwargs.update(pool_recycle=pool_recycle, pool_pre_ping=pool_pre_ping)
+    return kwargs
+
+
+def _pool_stats(pool: Pool, stats: PoolStats) -> Dict[str, Any]:
+    return stats.snapshot(pool.checkedout() if isinstance(pool, QueuePool) else 0)
+
+
+class SessionProvider:
+    """
+    Owns one engine and one sessionmaker, built once, and is itself the session dependency:
+
+        db = SessionProvider("mysql+pymysql://...", pool_size=10)
+        SQLModelCRUDRouter(db_func=db, db_model=Item)
+    """
+    engine: Engine
+    stats: PoolStats
+
+    def __init__(self,
+                 url: str,
+                 pool_size: int = 5,
+                 max_overflow: int = 10,
+                 pool_timeout: float = 30,
+                 pool_recycle: int = 3600,
+                 pool_pre_ping: bool = True,
+                 expire_on_commit: bool = False,
+                 **engine_kwargs: Any):
+        self.stats = PoolStats(pool_size, max_overflow)
+        self.engine = create_engine(url, **_engine_kwargs(
+            url, QueuePool, self.stats, pool_size, max_overflow,
+            pool_timeout, pool_recycle, pool_pre_ping, engine_kwargs))
+        self.sessionmaker = sessionmaker(self.engine, class_=Session, expire_on_commit=expire_on_commit)
+
+    def __call__(self) -> Generator[Session, Any, None]:
+        with self.sessionmaker() as session:
+            yield session
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return _pool_stats(self.engine.pool, self.stats)
+
+    def dispose(self) -> None:
+        self.engine.dispose()
+
+
+class AsyncSessionProvider:
+    """The `AsyncSession` counterpart of `SessionProvider`, e.g. for `AuthFactory`."""
+    engine: AsyncEngine
+    stats: PoolStats
+
+    def __init__(self,
+                 url: str,
+                 pool_size: int = 5,
+                 max_overflow: int = 10,
+                 pool_timeout: float = 30,
+                 pool_recycle: int = 3600,
+                 pool_pre_ping: bool = True,
+                 expire_on_commit: bool = False,
+                 **engine_kwargs: Any):
+        self.stats = PoolStats(pool_size, max_overflow)
+        self.engine = create_async_engine(url, **_engine_kwargs(
+            url, AsyncAdaptedQueuePool, self.stats, pool_size, max_overflow,
+            pool_timeout, pool_recycle, pool_pre_ping, engine_kwargs))
+        self.sessionmaker = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=expire_on_commit)
+
+    async def __call__(self) -> AsyncGenerator[AsyncSession, None]:
+        async with self.sessionmaker() as session:
+            yield session
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return _pool_stats(self.engine.sync_engine.pool, self.stats)
+
+    async def dispose(self) -> None:
+        await self.engine.dispose()
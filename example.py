@@ -1,10 +1,8 @@
 from typing import Optional, List
 from fastapi import FastAPI, Depends
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.orm import sessionmaker
-from sqlmodel import create_engine, SQLModel, Session, Field
-from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import SQLModel, Field
 
+from db import SessionProvider, AsyncSessionProvider
 from auth.item.models import AuthItemBase
 from auth.models import (BaseUser, BaseUserCreate, BaseUserUpdate, BaseUserDB,
                          BaseGroup, BaseGroupCreate, BaseGroupUpdate, BaseGroupDB)
@@ -20,31 +18,16 @@ with open('example.config.yaml', 'r') as file:
     password = config_data['database']['password']
     db_name = config_data['database']['db_name']
     host = config_data['database']['host']
-engine = create_engine(f"mysql+pymysql://{user}:{password}@{host}/{db_name}")
-async_engine = create_async_engine(f"mysql+aiomysql://{user}:{password}@{host}/{db_name}", future=True)
+# one engine and sessionmaker each, built at import time and shared by every request
+get_db = SessionProvider(f"mysql+pymysql://{user}:{password}@{host}/{db_name}", pool_size=10, max_overflow=20)
+get_async_session = AsyncSessionProvider(f"mysql+aiomysql://{user}:{password}@{host}/{db_name}", pool_size=5)
 
 
 async def create_db_and_tables():
-    async with async_engine.begin() as conn:
+    async with get_async_session.engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
 
 
-async def get_async_session() -> AsyncSession:
-    async_session = sessionmaker(
-        async_engine, class_=AsyncSession, expire_on_commit=False
-    )
-    async with async_session() as session:
-        yield session
-
-
-def get_db():
-    session = Session(engine)
-    try:
-        yield session
-    finally:
-        session.close()
-
-
 app = FastAPI()
 
 
@@ -92,6 +75,14 @@ async def test(u: Config.UserDB = Depends(auth.current_user),
     }
 
 
+@app.get('/pool')
+async def pool():
+    return {
+        'sync': get_db.pool_stats(),
+        'async': get_async_session.pool_stats(),
+    }
+
+
 ########################################################################################################################
 
 from auth.item.router import AuthCRUDRouter
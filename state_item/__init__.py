@@ -1,3 +1,4 @@
+from .hooks import HookQueue, HookRunner, MemoryQueue, RedisQueue, TransitionEvent
 from .models import StateBase, StateItemBase
 from .router import StateItemCRUDRouter
 from .utils import StatusRegistrar
@@ -7,4 +8,9 @@ __all__ = [
     'StateItemBase',
     'StateItemCRUDRouter',
     'StatusRegistrar',
+    'HookQueue',
+    'HookRunner',
+    'MemoryQueue',
+    'RedisQueue',
+    'TransitionEvent',
 ]
@@ -2,11 +2,12 @@ from abc import ABC, abstractmethod
 from typing import List, Type, Optional, Union, Any, Callable
 
 from fastapi import HTTPException, Response
-from graphviz import Digraph
 from sqlmodel import SQLModel
 
 from api_toolkit.crud import SQLModelCRUDRouter
+from api_toolkit.crud.admission import RouteClass
 from api_toolkit.crud.crud import SESSION_FUNC
+from api_toolkit.db.instrument import QueryInstrumentation
 from .types import T, DEPENDENCIES
 from .utils import StatusRegistrar
 from .models import StateItemBase
@@ -23,6 +24,8 @@ class StateItemCRUDGenerator(SQLModelCRUDRouter, ABC):
             registrar: StatusRegistrar,
             db_func: SESSION_FUNC,
             db_model: Type[SQLModel],
+            filter_fields: Optional[List[str]] = None,
+            order_fields: Optional[List[str]] = None,
             create_schema: Optional[Type[T]] = None,
             update_schema: Optional[Type[T]] = None,
             prefix: Optional[str] = None,
@@ -37,14 +40,36 @@ class StateItemCRUDGenerator(SQLModelCRUDRouter, ABC):
             delete_one_route: Union[bool, DEPENDENCIES] = True,
             delete_all_route: Union[bool, DEPENDENCIES] = True,
             delete_all_in_state_route: Union[bool, DEPENDENCIES] = True,
+            read_db_func: Optional[SESSION_FUNC] = None,
+            read_your_writes: float = 0,
+            instrumentation: Optional[QueryInstrumentation] = None,
+            get_many_route: Union[bool, DEPENDENCIES] = True,
             **kwargs: Any,
     ) -> None:
+        self.registrar = registrar
         super().__init__(
-            db_func, db_model, create_schema, update_schema, prefix, tags,
-            get_all_route, get_one_route, create_route, update_route,
-            delete_one_route, delete_all_route, **kwargs,
+            db_func=db_func,
+            db_model=db_model,
+            filter_fields=filter_fields,
+            order_fields=order_fields,
+            create_schema=create_schema,
+            update_schema=update_schema,
+            prefix=prefix,
+            tags=tags,
+            get_all_route=get_all_route,
+            get_one_route=get_one_route,
+            get_many_route=get_many_route,
+            create_route=create_route,
+            update_route=update_route,
+            delete_one_route=delete_one_route,
+            delete_all_route=delete_all_route,
+            read_db_func=read_db_func,
+            read_your_writes=read_your_writes,
+            instrumentation=instrumentation,
+            **kwargs,
         )
-        self.registrar = registrar
+        if self.broadcaster and registrar.broadcaster is None:
+            registrar.broadcaster = self.broadcaster
         if get_all_in_state_route:
             self._add_api_route(
                 "/",
@@ -53,6 +78,7 @@ class StateItemCRUDGenerator(SQLModelCRUDRouter, ABC):
                 response_model=Optional[List[self.schema]],  # type: ignore
                 summary="Get all items in this state",
                 dependencies=get_all_in_state_route,
+                coalesce=True,
             )
         if create_in_state_route:
             self._add_api_route(
@@ -81,7 +107,8 @@ class StateItemCRUDGenerator(SQLModelCRUDRouter, ABC):
                     summary=f"Transition this item from state {from_state.name} to state {to_state.name}",
                     response_model=self.registrar.response_model(),
                     error_responses=[BAD_REQUEST],
-                    dependencies=trans_info.dependencies
+                    dependencies=trans_info.dependencies,
+                    admission_class=RouteClass.transition,
                 )
             self._add_api_route(
                 f"/flow/chart",
@@ -104,6 +131,9 @@ class StateItemCRUDGenerator(SQLModelCRUDRouter, ABC):
         raise NotImplementedError
 
     def _generate_flowchart(self):
+        # graphviz is only needed once a flowchart is rendered
+        from graphviz import Digraph
+
         dot = Digraph(comment=f'{self.prefix} Flowchart')
         dot.attr(rankdir='LR')
         dot.attr(fontname='FangSong')
@@ -111,6 +141,8 @@ class StateItemCRUDGenerator(SQLModelCRUDRouter, ABC):
             dot.node(str(state.value), state.name)
         for (from_state, to_state), v in self.registrar.state_transition_process.items():
             dot.edge(str(from_state.value), str(to_state.value), label=v.name)
+        for rule in self.registrar.sweeper.rules:
+            dot.edge(str(rule.from_state.value), str(rule.to_state.value), label=f"after {rule.after}", style="dashed")
 
         image_data = dot.pipe(format='png')
 
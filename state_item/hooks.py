@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from api_toolkit.crud.changes import LoopBound
+
+logger = logging.getLogger("api_toolkit.state_item.hooks")
+
+HOOK = Callable[["TransitionEvent"], Any]
+
+
+class TransitionEvent(BaseModel):
+    topic: str
+    item_id: Any
+    from_state: Any
+    to_state: Any
+    data: Any = None
+
+
+class HookJob(BaseModel):
+    hook: str
+    event: TransitionEvent
+    attempt: int = 0
+
+
+def hook_name(func: Callable[..., Any]) -> str:
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+class HookQueue(ABC):
+    """Carries hook jobs to the workers, a shared backend lets any process run the hooks it has registered."""
+    # whether queued jobs outlive the process, the runner drains a queue that is not durable when it stops
+    durable: bool = False
+
+    async def connect(self) -> None:
+        pass
+
+    async def disconnect(self) -> None:
+        pass
+
+    @abstractmethod
+    async def put(self, job: HookJob) -> bool:
+        """Enqueue `job`, False when the queue is full and the job was not taken."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self) -> HookJob:
+        raise NotImplementedError
+
+
+class MemoryQueue(HookQueue):
+    def __init__(self, maxsize: int = 10000):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    async def put(self, job: HookJob) -> bool:
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def get(self) -> HookJob:
+        return await self._queue.get()
+
+
+class RedisQueue(HookQueue):
+    """A Redis list, needs the `redis` package (4.2 or later)."""
+    durable = True
+
+    def __init__(self, url: str, key: str = "api_toolkit.hooks"):
+        self.url = url
+        self.key = key
+        self._redis: Any = None
+
+    async def connect(self) -> None:
+        from redis import asyncio as aioredis
+
+        self._redis = aioredis.from_url(self.url)
+
+    async def disconnect(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    async def put(self, job: HookJob) -> bool:
+        await self._redis.lpush(self.key, job.json())
+        return True
+
+    async def get(self) -> HookJob:
+        _, message = await self._redis.brpop(self.key)
+        return HookJob.parse_raw(message)
+
+
+class HookRunner(LoopBound):
+    """
+    Runs transition hooks after the transaction committed, on `workers` background tasks. Sync hooks
+    run on a thread pool of the same size, apart from the one serving requests. A failing hook is retried
+    `max_retries` times, `backoff` seconds doubling per attempt up to `max_backoff`, and is then kept
+    in `failed` (the last `failed_size` jobs) and logged. `submit` can be called from sync routes.
+    On shutdown pending retries are run right away and the jobs held in this process get up to
+    `drain_timeout` seconds to finish, whatever is left then is logged and counted as dropped.
+    """
+
+    def __init__(self,
+                 queue: Optional[HookQueue] = None,
+                 workers: int = 4,
+                 max_retries: int = 3,
+                 backoff: float = 0.5,
+                 max_backoff: float = 30,
+                 failed_size: int = 100,
+                 drain_timeout: float = 5):
+        self.queue = queue or MemoryQueue()
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.drain_timeout = drain_timeout
+        self.hooks: Dict[str, HOOK] = {}
+        self.failed: Deque[HookJob] = deque(maxlen=failed_size)
+        self.succeeded = 0
+        self.failures = 0
+        self.retried = 0
+        self.dropped = 0
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connected: Optional[asyncio.Event] = None
+        # jobs this process is responsible for: submitted, queued in memory, running or waiting to retry
+        self._held = 0
+        self._retries: Dict[object, Tuple[asyncio.TimerHandle, HookJob]] = {}
+        self._stopping = False
+
+    def register(self, func: HOOK, name: Optional[str] = None) -> str:
+        """
+        Register `func` under `name`, by default its module and qualified name, which jobs refer to it by.
+        Functions made by a factory share a qualified name and need a `name` each.
+        """
+        name = name or hook_name(func)
+        registered = self.hooks.get(name)
+        if registered is not None and registered is not func:
+            raise ValueError(f"another hook is already registered as {name}, give this one a name of its own.")
+        self.hooks[name] = func
+        return name
+
+    async def start(self) -> None:
+        self._bind()
+
+    async def stop(self) -> None:
+        if self._loop is not None:
+            await self._drain()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._held = 0
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        await self.queue.disconnect()
+        self._loop = None
+
+    async def _drain(self) -> None:
+        self._stopping = True
+        for handle, job in self._retries.values():
+            handle.cancel()
+            self._loop.create_task(self._enqueue(job))
+        self._retries.clear()
+        deadline = time.monotonic() + self.drain_timeout
+        while self._held and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._held:
+            logger.error("hook runner stopped with %d jobs unfinished, they are dropped", self._held)
+            self.dropped += self._held
+        self._stopping = False
+
+    def _bind(self) -> None:
+        super()._bind()
+        if not self._tasks:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="api_toolkit_hook")
+            self._connected = asyncio.Event()
+            self._tasks = [self._loop.create_task(self._work(i == 0)) for i in range(self.workers)]
+
+    async def _work(self, connect: bool) -> None:
+        if connect:
+            await self.queue.connect()
+            self._connected.set()
+        await self._connected.wait()
+        while True:
+            job = await self.queue.get()
+            if self.queue.durable:
+                self._held += 1
+            try:
+                await self._run(job)
+            finally:
+                self._held -= 1
+
+    async def _run(self, job: HookJob) -> None:
+        func = self.hooks.get(job.hook)
+        if func is None:
+            logger.warning("hook %s is not registered in this process, job dropped", job.hook)
+            self.dropped += 1
+            return
+        try:
+            if asyncio.iscoroutinefunction(func):
+                await func(job.event)
+            else:
+                await self._loop.run_in_executor(self._executor, func, job.event)
+        except Exception:
+            if job.attempt >= self.max_retries:
+                logger.exception("hook %s failed for %s %s, giving up after %d attempts",
+                                 job.hook, job.event.topic, job.event.item_id, job.attempt + 1)
+                self.failures += 1
+                self.failed.append(job)
+                return
+            self.retried += 1
+            retry = job.copy(update={"attempt": job.attempt + 1})
+            self._held += 1
+            if self._stopping:
+                self._loop.create_task(self._enqueue(retry))
+                return
+            token = object()
+            delay = min(self.backoff * 2 ** job.attempt, self.max_backoff)
+            self._retries[token] = (self._loop.call_later(delay, self._retry, token), retry)
+        else:
+            self.succeeded += 1
+
+    def _retry(self, token: object) -> None:
+        _, job = self._retries.pop(token)
+        self._loop.create_task(self._enqueue(job))
+
+    async def _enqueue(self, job: HookJob) -> None:
+        await self._connected.wait()
+        if not await self.queue.put(job):
+            logger.error("hook queue full, %s for %s %s dropped", job.hook, job.event.topic, job.event.item_id)
+            self.dropped += 1
+            self._held -= 1
+        elif self.queue.durable:
+            # the backend holds it from now on
+            self._held -= 1
+
+    def _dispatch(self, jobs: List[HookJob]) -> None:
+        # runs on the event loop
+        self._bind()
+        self._held += len(jobs)
+        for job in jobs:
+            self._loop.create_task(self._enqueue(job))
+
+    def submit(self, hooks: List[str], event: TransitionEvent) -> None:
+        jobs = [HookJob(hook=name, event=event) for name in hooks]
+        if not jobs:
+            return
+        if not self._call_soon(self._dispatch, jobs):
+            logger.warning("hooks dropped, the hook runner is not started: %s", [job.hook for job in jobs])
+            self.dropped += len(jobs)
+
+    def stats(self) -> Dict[str, int]:
+        return {"succeeded": self.succeeded, "retried": self.retried, "failed": self.failures,
+                "dropped": self.dropped, "registered": len(self.hooks)}
@@ -12,4 +12,5 @@ class StateItemBase(SQLModel, metaclass=ABCMeta):
     id: Optional[int] = Field(primary_key=True)
     state: StateBase
     created_time: datetime = Field(default_factory=datetime.now)
-    updated_time: datetime = Field(default_factory=datetime.now)
+    # indexed for the keyset scans of the `/delta` route
+    updated_time: datetime = Field(default_factory=datetime.now, index=True)
@@ -1,8 +1,10 @@
-from typing import Any, Callable, List
+from typing import Any, Callable, List, Optional
 
 from fastapi import Depends
+from fastapi.encoders import jsonable_encoder
 from sqlmodel import Session, select, SQLModel
 
+from api_toolkit.crud.changes import MATCH
 from api_toolkit.crud.crud import CALLABLE_LIST
 
 from .base import StateItemCRUDGenerator
@@ -12,7 +14,7 @@ class StateItemCRUDRouter(StateItemCRUDGenerator):
 
     def _get_all_in_state(self, *args: Any, **kwargs: Any) -> CALLABLE_LIST:
         def route(state: self.registrar.state_type,  # type: ignore
-                  db: Session = Depends(self.db_func)):
+                  db: Session = Depends(self._read_db())):
             return db.exec(
                 select(self.db_model).
                 where(self.db_model.state == state)
@@ -20,6 +22,16 @@ class StateItemCRUDRouter(StateItemCRUDGenerator):
 
         return route
 
+    def _changes_match(self) -> Callable[..., MATCH]:
+        def match(state: Optional[self.registrar.state_type] = None) -> MATCH:  # type: ignore
+            if state is None:
+                return None
+            value = jsonable_encoder(state)
+            # items entering and leaving the state
+            return lambda event: event.state == value or event.previous_state == value
+
+        return match
+
     def _create_in_state(self, *args: Any, **kwargs: Any) -> Callable[..., Any]:
         def route(state: self.registrar.state_type,  # type: ignore
                   db: Session = Depends(self.db_func)):
@@ -0,0 +1,140 @@
+import asyncio
+import contextlib
+import datetime
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, update
+from sqlmodel import Session
+
+from api_toolkit.crud.changes import ChangeEvent
+from api_toolkit.crud.delta import TRACKED
+from .hooks import TransitionEvent
+from .models import StateBase
+
+if TYPE_CHECKING:
+    from .utils import StatusRegistrar
+
+logger = logging.getLogger("api_toolkit.state_item.sweeper")
+
+
+class TimeoutRule:
+    from_state: StateBase
+    to_state: StateBase
+    after: datetime.timedelta
+
+    def __init__(self, from_state: StateBase, to_state: StateBase, after: datetime.timedelta):
+        self.from_state = from_state
+        self.to_state = to_state
+        self.after = after
+
+
+class TimeoutSweeper:
+    """
+    Applies the timeout transitions of a registrar: every `interval` seconds, items that have been in
+    the `from_state` of a rule for longer than its `after`, going by `updated_time`, move oldest first
+    in batches of `batch_size` ids, one guarded UPDATE per batch and at most `limit` items per rule and tick.
+    Moved items are published and their hooks submitted as for a transition over HTTP; the transition
+    function itself is not called, a timeout has no request arguments to pass it.
+    """
+
+    def __init__(self, registrar: "StatusRegistrar", interval: float = 60, batch_size: int = 500,
+                 limit: int = 5000):
+        self.registrar = registrar
+        self.interval = interval
+        self.batch_size = batch_size
+        self.limit = limit
+        self.rules: List[TimeoutRule] = []
+        self.swept = 0
+        self._task: Optional[asyncio.Task] = None
+        # checked between batches, so a sweep running in the threadpool ends with its current batch
+        self._stopping = threading.Event()
+        self._wake: Optional[asyncio.Event] = None
+
+    async def start(self) -> None:
+        if self.rules and self._task is None:
+            self._stopping.clear()
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            # not cancelled: a sweep in the threadpool would go on regardless, this waits for its batch to commit
+            self._stopping.set()
+            self._wake.set()
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await run_in_threadpool(self.sweep)
+            except Exception:
+                logger.exception("timeout sweep failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def sweep(self, now: Optional[datetime.datetime] = None) -> int:
+        """Apply every rule once, returns the number of items moved."""
+        now = now or datetime.datetime.now()
+        moved = 0
+        with contextlib.contextmanager(self.registrar._db_func)() as db:
+            for rule in self.rules:
+                moved += self._sweep_rule(db, rule, now)
+        self.swept += moved
+        return moved
+
+    def _sweep_rule(self, db: Session, rule: TimeoutRule, now: datetime.datetime) -> int:
+        model = self.registrar.state_item_type
+        table = model.__table__
+        pk = table.primary_key.columns.values()[0]
+        state, updated_time = table.c.state, table.c.updated_time
+        stamp = {"state": rule.to_state, "updated_time": now}
+        if table in TRACKED:
+            # the UPDATE skips the listener keeping the column of the `/delta` route current
+            stamp[TRACKED[table][0]] = now
+        hooks = self.registrar._after_commit.get((rule.from_state, rule.to_state), []) \
+            + self.registrar._on_enter.get(rule.to_state, [])
+        notify = bool(self.registrar.broadcaster or hooks)
+
+        moved = 0
+        while moved < self.limit and not self._stopping.is_set():
+            # served by the index on updated_time, oldest first so a backlog drains in order
+            ids = db.execute(select(pk).where(state == rule.from_state, updated_time < now - rule.after)
+                             .order_by(updated_time, pk).limit(min(self.batch_size, self.limit - moved))
+                             ).scalars().all()
+            if not ids:
+                break
+            selected = len(ids)
+            # the state guard skips items a concurrent request moved since they were read
+            result = db.execute(update(table).where(pk.in_(ids), state == rule.from_state)
+                                .values(stamp))
+            if result.rowcount != len(ids):
+                # read back in the same transaction, a comparison on `now` fails on columns without microseconds
+                ids = db.execute(select(pk).where(pk.in_(ids), state == rule.to_state)).scalars().all()
+            items = db.execute(select(model).where(pk.in_(ids))).scalars().all() if notify else []
+            db.commit()
+            moved += len(ids)
+            self._notify(rule, items, hooks)
+            if selected < self.batch_size:
+                break
+        return moved
+
+    def _notify(self, rule: TimeoutRule, items: List[Any], hooks: List[str]) -> None:
+        topic = self.registrar.state_item_type.__tablename__
+        from_state, to_state = jsonable_encoder(rule.from_state), jsonable_encoder(rule.to_state)
+        pk = self.registrar.state_item_type.__table__.primary_key.columns.keys()[0]
+        for item in items:
+            item_id, data = getattr(item, pk), jsonable_encoder(item)
+            if self.registrar.broadcaster:
+                self.registrar.broadcaster.publish(ChangeEvent(
+                    topic=topic, action="transition", id=item_id, state=to_state, previous_state=from_state,
+                    data=data))
+            if hooks:
+                self.registrar.hooks.submit(hooks, TransitionEvent(
+                    topic=topic, item_id=item_id, from_state=from_state, to_state=to_state, data=data))
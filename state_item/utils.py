@@ -1,12 +1,17 @@
 import datetime
+from collections import defaultdict
 from typing import Generic, Type, TypeVar, Dict, Tuple, Callable, Union, Optional, \
     Sequence, get_type_hints, List, Any, Generator
 
 from fastapi import Depends, HTTPException, status, FastAPI
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from sqlmodel import Session
 
+from api_toolkit.crud.changes import Broadcaster, ChangeEvent
+from .hooks import HOOK, HookRunner, TransitionEvent
 from .models import StateBase, StateItemBase
+from .sweeper import TimeoutRule, TimeoutSweeper
 
 StateType = TypeVar('StateType', bound=StateBase)
 StateItemType = TypeVar('StateItemType', bound=StateItemBase)
@@ -40,9 +45,23 @@ class StatusRegistrar(Generic[StateType, StateItemType]):
     def response_model(self):
         return self.Model
 
-    def __init__(self, db_func: Callable[..., Generator[Session, Any, None]], app: FastAPI):
+    def __init__(self, db_func: Callable[..., Generator[Session, Any, None]], app: FastAPI,
+                 broadcaster: Optional[Broadcaster] = None, hooks: Optional[HookRunner] = None,
+                 sweep_interval: float = 60, sweep_batch_size: int = 500, sweep_limit: int = 5000):
         self._db_func = db_func
         self.app = app
+        # transitions are published here, StateItemCRUDRouter fills it in from its own broadcaster
+        self.broadcaster = broadcaster
+        # runs the on_enter and after_commit hooks once the transition committed
+        self.hooks = hooks or HookRunner()
+        self._on_enter: Dict[StateType, List[str]] = defaultdict(list)
+        self._after_commit: Dict[StateTransIdentifier, List[str]] = defaultdict(list)
+        # applies the timeout transitions, runs only when some are registered
+        self.sweeper = TimeoutSweeper(self, sweep_interval, sweep_batch_size, sweep_limit)
+        app.add_event_handler("startup", self.hooks.start)
+        app.add_event_handler("startup", self.sweeper.start)
+        app.add_event_handler("shutdown", self.sweeper.stop)
+        app.add_event_handler("shutdown", self.hooks.stop)
 
     def bind(self, state_type: Type[StateType], state_item_type: Type[StateItemType]):
         self.state_type = state_type
@@ -65,7 +84,6 @@ class StatusRegistrar(Generic[StateType, StateItemType]):
 
             def wrapper(item_id: int, db: Session, *args, **kwargs):
                 runtime_self: StateItemBase = db.get(self.state_item_type, item_id)
-                print(runtime_self)
                 runtime_obj = self.state_item_type.from_orm(runtime_self)
                 if runtime_self.state != from_state:
                     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
@@ -75,7 +93,18 @@ class StatusRegistrar(Generic[StateType, StateItemType]):
                 runtime_self.state = to_state
                 runtime_self.updated_time = datetime.datetime.now()
                 func(runtime_self, *args, **kwargs)
+                hooks = self._after_commit.get((from_state, to_state), []) + self._on_enter.get(to_state, [])
+                data = jsonable_encoder(self.state_item_type.from_orm(runtime_self)) \
+                    if self.broadcaster or hooks else None
                 db.commit()
+                if self.broadcaster:
+                    self.broadcaster.publish(ChangeEvent(
+                        topic=self.state_item_type.__tablename__, action="transition", id=item_id,
+                        state=jsonable_encoder(to_state), previous_state=jsonable_encoder(from_state), data=data))
+                if hooks:
+                    self.hooks.submit(hooks, TransitionEvent(
+                        topic=self.state_item_type.__tablename__, item_id=item_id,
+                        from_state=jsonable_encoder(from_state), to_state=jsonable_encoder(to_state), data=data))
 
                 return {
                     'code': 200,
@@ -96,6 +125,33 @@ def wrapper_reshape(item_id: int{',' if vars_with_type else ''} {vars_with_type}
 
         return decorator
 
+    def on_enter(self, state: StateType, name: Optional[str] = None):
+        """Register a hook run in the background after any transition into `state` committed."""
+        def decorator(func: HOOK) -> HOOK:
+            self._on_enter[state].append(self.hooks.register(func, name))
+            return func
+
+        return decorator
+
+    def after_commit(self, from_state: StateType, to_state: StateType, name: Optional[str] = None):
+        """
+        Register a hook run in the background after the transition `from_state` -> `to_state` committed,
+        for side effects (notifications, external APIs) that must not hold the transaction or the request.
+        """
+        def decorator(func: HOOK) -> HOOK:
+            self._after_commit[(from_state, to_state)].append(self.hooks.register(func, name))
+            return func
+
+        return decorator
+
+    def timeout(self, from_state: StateType, to_state: StateType, after: datetime.timedelta) -> None:
+        """
+        Move items that have been in `from_state` for longer than `after` (by `updated_time`) to `to_state`,
+        e.g. `registrar.timeout(ProductState.Shipped, ProductState.Missed, datetime.timedelta(days=7))`.
+        Applied in the background by `self.sweeper`, batched and oldest first.
+        """
+        self.sweeper.rules.append(TimeoutRule(from_state, to_state, after))
+
     def transitions(self) -> Dict[StateTransIdentifier, StateTransInfo]:
         return self._state_transition_process.copy()
 